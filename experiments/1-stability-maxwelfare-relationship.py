@@ -5,52 +5,76 @@ from utils import *
 from multiprocessing import Pool, cpu_count
 from functools import partial
 
-def process_single_ranking(ranking, arrangements, utility_func, n):
+def process_single_ranking(ranking, utility_func, n):
   """Process a single ranking and return whether any welfare-maximizing arrangement is stable."""
   profile = generate_utilities(ranking, utility_func, n)
 
-  best_welfare_for_util_profile = -1
-  best_arr_for_util_profile = []
-
-  for arr in arrangements:
-    welfare = calculate_total_utility(profile, arr)
-    if welfare > best_welfare_for_util_profile:
-      best_welfare_for_util_profile = welfare
-      best_arr_for_util_profile = [arr]
-    elif welfare == best_welfare_for_util_profile:
-      best_arr_for_util_profile.append(arr)
+  # Held-Karp DP instead of evaluating all (n-1)!/2 arrangements; ties are generated lazily
+  best_welfare_for_util_profile, best_arr_for_util_profile = max_welfare_arrangements(profile)
 
   # Check if any of the best arrangements is stable
   any_stable = any(is_stable(profile, arr) for arr in best_arr_for_util_profile)
 
   return any_stable
 
+MAX_N_TO_SCORE_ALL_ARRANGEMENTS = 8 #(n-1)!/2 = 2520 arrangements, past that the DP is faster
+PROFILE_BATCH = 64
+
+def process_ranking_batch(rankings, utility_func, n):
+  """Same as process_single_ranking for a list of rankings, scoring every arrangement of every profile at once (small n only)."""
+  profiles = np.stack([generate_utilities(ranking, utility_func, n) for ranking in rankings])
+  arrangements = arrangement_edge_ids(n)[0]
+
+  _, optimal = max_welfare_arrangements_batch(profiles)
+  return [stable_arrangements_mask(profile, arrangements[mask]).any() for profile, mask in zip(profiles, optimal)]
+
+def process_ranking_range(start, stop, exhaustive, utility_func, n):
+  """Process the ranking profiles with index in [start, stop) and return how many have a stable welfare-maximizing arrangement.
+  exhaustive: only the relabeling orbit representatives in [start, stop) are processed, each counting for its whole orbit."""
+  people = list(range(n))
+  if exhaustive:
+    weighted_rankings = (
+      (get_ranking_profile(people, index, True), orbit_size)
+      for index, orbit_size in iter_ranking_profile_orbits(n, start, stop)
+    )
+  else:
+    weighted_rankings = ((ranking, 1) for ranking in iter_ranking_profiles(people, start, stop))
+
+  if n > MAX_N_TO_SCORE_ALL_ARRANGEMENTS:
+    return sum(weight * process_single_ranking(ranking, utility_func, n) for ranking, weight in weighted_rankings)
+
+  stable_count = 0
+  while batch := list(itertools.islice(weighted_rankings, PROFILE_BATCH)):
+    rankings, weights = zip(*batch)
+    stable_count += sum(weight * any_stable for weight, any_stable in zip(weights, process_ranking_batch(rankings, utility_func, n)))
+  return stable_count
+
 def analyze_stability_welfare_relationship(n, num_processes, utility_func, utility_name, NUM_RANDOM_SAMPLES=1_000_000):
   """Analyze the relationship between welfare maximization and stability for given n and utility function."""
-  people = [excel_label(i) for i in range(n)]
-  arrangements = get_circular_arrangements(people)
+  people = list(range(n))
 
   # print(f"\n{'='*60}")
   # print(f"Running analysis for n={n} with {utility_name} utility")
   # print(f"{'='*60}")
-  # print(f"Number of unique circular arrangements: {len(arrangements)}")
 
-  if (n > 5): #too many to generate all ranking profiles possible, so sample instead
-    rankings_list = [generate_random_rankings(people) for _ in range(NUM_RANDOM_SAMPLES)]
+  exhaustive = (n <= 5) #too many to generate all ranking profiles possible past n=5, so sample instead
+  if exhaustive:
+    total_profiles = num_ranking_profiles(n)
   else:
-    rankings_list = list(generate_all_rankings(people))
-  total_profiles = len(rankings_list)
+    total_profiles = NUM_RANDOM_SAMPLES
   # print(f"Total number of ranking profiles: {total_profiles}")
 
   # Create partial function with fixed arguments
-  process_func = partial(process_single_ranking,
-                         arrangements=arrangements,
+  process_func = partial(process_ranking_range,
+                         exhaustive=exhaustive,
                          utility_func=utility_func,
                          n=n)
 
-  # Process in parallel
+  # Process in parallel. workers generate the profiles of their own index range, nothing is materialized here
+  # exhaustive: relabeled profiles cover every orbit, workers split those up
+  num_indices = num_relabeled_ranking_profiles(n) if exhaustive else total_profiles
   with Pool(processes=num_processes) as pool:
-    results = pool.map(process_func, rankings_list)
+    results = pool.starmap(process_func, split_index_range(num_indices, num_processes))
 
   # Count results
   stable_count = sum(results)
@@ -93,7 +117,7 @@ def main():
       (ranking_to_binary_utility, "binary")
     ]
 
-    for n in range(4, 9):    
+    for n in range(4, 13): #max welfare via DP, so no longer limited by enumerating arrangements
         results = []
         for utility_func, utility_name in utility_functions:
             result = analyze_stability_welfare_relationship(n, num_processes, utility_func, utility_name)
@@ -4,18 +4,17 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils import *
 
 def analyze_naive_swapping(n, utility_func, NUM_RANDOM_SAMPLES=7_962_624):
-    people = [excel_label(i) for i in range(n)]
+    people = list(range(n))
 
-    rankings = [generate_random_rankings(people) for _ in range(NUM_RANDOM_SAMPLES)]
+    batches = iter_random_profile_batches(n, utility_func, NUM_RANDOM_SAMPLES) #generated lazily, a batch at a time
 
     num_times_recovered = 0
-    for ranking in rankings:
-        profile = generate_utilities(ranking, utility_func, n)
-        
-        final_arr = run_naive_swapping(people, profile)
-        
-        if(final_arr != None and is_stable(profile, final_arr)):
-            num_times_recovered += 1
+    for rankings, ranks, profiles in batches:
+        for profile in profiles:
+            final_arr = run_naive_swapping(people, profile)
+
+            if(final_arr != None and is_stable(profile, final_arr)):
+                num_times_recovered += 1
 
     print("Percentage Recovered:", num_times_recovered/NUM_RANDOM_SAMPLES)
 
@@ -4,51 +4,37 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils import *
 from multiprocessing import Pool, cpu_count
 
-def analyze_simulated_annealing_accuracy(n, utility_func, utility_name, NUM_RANDOM_SAMPLES=7_962_624):
-  NUM_PARALLEL_RUNS = 10 
-
-  people = [excel_label(i) for i in range(n)]
-  rankings = [generate_random_rankings(people) for _ in range(NUM_RANDOM_SAMPLES)]
+NUM_PARALLEL_RUNS = 10 # PARALLELIZED
+PARALLEL_PROFILES = True #run whole profiles in parallel (all cores) instead of only the 10 SA runs of one profile
+BATCHED_SA = True #anneal the SA runs of many profiles together with numpy (see run_batched_simulated_annealing)
+STAGES = [SA_MAX_STAGE]
 
+def analyze_simulated_annealing_accuracy(n, utility_func, utility_name, pool, NUM_RANDOM_SAMPLES=7_962_624):
   #metrics
   num_times_recovered = 0
   num_times_not_recovered_bc_no_stable_solution = 0
   num_times_not_recovered_but_stable_solution = 0
+  num_times_not_recovered_unknown = 0 #exact search gave up (EXACT_CHECK_MAX_NODES)
 
-  for ranking in rankings:
-    profile = generate_utilities(ranking, utility_func, n)
-
-    num_stable = 0
-
-    #parallelize 10 SA runs
-    sa_seeds = [random.randrange(2**32) for _ in range(NUM_PARALLEL_RUNS)] #each parallel process needs its own seed to produce independent runs
-    sa_args = [
-      (n, people, profile, utility_func, utility_name, True, seed)
-      for seed in sa_seeds
-    ]
-    with Pool(processes=min(NUM_PARALLEL_RUNS, cpu_count())) as pool:
-      final_arrangements = pool.map(run_single_sa, sa_args)
-
-    #check results from SA runs
-    for final_arrangement in final_arrangements:
-      #found a stable arrangement
-      if(is_stable(profile, final_arrangement)):
-        num_stable += 1
-        break
-
-    if(num_stable == 0):
-      #see if a stable matching exists, for such a profile
-      if(does_stable_arr_exist_for_profile(people, profile)):
+  #SA runs, then see if a stable matching exists for profiles where SA didn't find one
+  outcomes = run_pipeline_over_profiles(pool, n, utility_func, NUM_RANDOM_SAMPLES, STAGES, NUM_PARALLEL_RUNS, True, PARALLEL_PROFILES, batched_sa=BATCHED_SA)
+  for found_at_stage, stable_exists in outcomes:
+    if(found_at_stage == None):
+      if(stable_exists == True):
         num_times_not_recovered_but_stable_solution += 1
 
-      else:
+      elif(stable_exists == False):
         num_times_not_recovered_bc_no_stable_solution += 1
+
+      else:
+        num_times_not_recovered_unknown += 1
     else:
       num_times_recovered += 1
 
   print("Percentage Recovered:", num_times_recovered/NUM_RANDOM_SAMPLES)
   print("Percentage Not Recovered (No Stable Solution Exists):", num_times_not_recovered_bc_no_stable_solution/NUM_RANDOM_SAMPLES)
   print("Percentage Not Recovered (Stable Solution Exists):", num_times_not_recovered_but_stable_solution/NUM_RANDOM_SAMPLES)
+  print("Percentage Not Recovered (Unknown, Exact Search Gave Up):", num_times_not_recovered_unknown/NUM_RANDOM_SAMPLES)
 
 def main():
     random.seed(GLOBAL_SEED)
@@ -62,17 +48,19 @@ def main():
     ]
 
 
-    for n in range(4, 11):
-      print("="*80)
-      print(f"n={n}")
-      print("\n")
+    #one pool for the whole sweep, reused by every profile
+    with create_solver_pool(cpu_count() if PARALLEL_PROFILES else min(NUM_PARALLEL_RUNS, cpu_count())) as pool:
+        for n in range(4, 11):
+          print("="*80)
+          print(f"n={n}")
+          print("\n")
 
-      for utility_func, utility_name in utility_functions:
-          print(f"{utility_name}")
-          analyze_simulated_annealing_accuracy(n, utility_func, utility_name, NUM_SAMPLES)
-          print("-"*80)
+          for utility_func, utility_name in utility_functions:
+              print(f"{utility_name}")
+              analyze_simulated_annealing_accuracy(n, utility_func, utility_name, pool, NUM_SAMPLES)
+              print("-"*80)
 
-      print("="*80)
+          print("="*80)
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -4,93 +4,63 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils import *
 from multiprocessing import Pool, cpu_count
 
-def analyze_simulated_annealing_swapping_blocking_pairs_accuracy(n, utility_func, utility_name, NUM_RANDOM_SAMPLES=7_962_624, debug=False):
-  NUM_PARALLEL_RUNS = 10 
-  MAX_N_TO_BRUTE_FORCE_CHECK = 10
+NUM_PARALLEL_RUNS = 10 # PARALLELIZED
+PARALLEL_PROFILES = True #run whole profiles in parallel (all cores) instead of only the 10 SA runs of one profile
+BATCHED_SA = True #anneal the SA runs of many profiles together with numpy (see run_batched_simulated_annealing)
+STAGES = [SA_MAX_STAGE, SWAP_STAGE]
 
-  people = [excel_label(i) for i in range(n)]
-  rankings = [generate_random_rankings(people) for _ in range(NUM_RANDOM_SAMPLES)]
+def analyze_simulated_annealing_swapping_blocking_pairs_accuracy(n, utility_func, utility_name, pool, NUM_RANDOM_SAMPLES=7_962_624, debug=False):
+  MAX_N_TO_EXACT_CHECK = 17 #exact search (branch and bound), gives up after EXACT_CHECK_MAX_NODES (counted as unknown)
 
   #metrics
   num_times_recovered = 0
   num_times_not_recovered_but_stable_solution = 0
   num_times_not_recovered_bc_no_stable_solution = 0
+  num_times_not_recovered_unknown = 0
 
   num_times_found_after_initial_SA = 0
   num_times_found_after_swapping_pairs = 0
 
-  for ranking in rankings:
-    profile = generate_utilities(ranking, utility_func, n)
-
-    num_stable = 0
-
-    final_nonstable_arrangments = {}
-
-    #parallelize 10 SA runs
-    sa_seeds = [random.randrange(2**32) for _ in range(NUM_PARALLEL_RUNS)] #each parallel process needs its own seed to produce independent runs   
-    sa_args = [
-      (n, people, profile, utility_func, utility_name, True, seed)
-      for seed in sa_seeds
-    ]
-    with Pool(processes=min(NUM_PARALLEL_RUNS, cpu_count())) as pool:
-      final_arrangements = pool.map(run_single_sa, sa_args)
-
-    #check results from SA runs
-    for final_arr in final_arrangements:
-      blocking_pair = find_blocking_pair(profile, final_arr)
-
-      #found stable arrangement
-      if(blocking_pair == None):
-        num_stable += 1
-        num_times_found_after_initial_SA += 1
-        break
-      else:
-        final_nonstable_arrangments[final_arr] = blocking_pair
-
-    #if none of the max welfare arrangements are stable, 
-    #then try swapping blocking pairs and see if we can find a stable pair "nearby"
-    if(num_stable == 0):
-      for final_arr, blocking_pair in final_nonstable_arrangments.items():
-        final = run_swap_blocking_pairs(profile, final_arr, blocking_pair)
-        if(final != None):
-          num_stable += 1
-          num_times_found_after_swapping_pairs += 1
-          break
-
-      #after swapping blocking pairs, did not find a stable arrangement
-      if(num_stable == 0):
-        if(debug):
-          print("No stable arrangement found after SA + blocking pairs.")
-
-        #check all arrangements to see if a stable one exists
-        #only do so if there's less than a trillion arrangements
-        if(n < MAX_N_TO_BRUTE_FORCE_CHECK):
-          if(does_stable_arr_exist_for_profile(people, profile)):
-            num_times_not_recovered_but_stable_solution += 1
-
-          else:
-            num_times_not_recovered_bc_no_stable_solution += 1
+  #SA runs. if none of the max welfare arrangements are stable,
+  #then try swapping blocking pairs and see if we can find a stable pair "nearby"
+  #check all arrangements to see if a stable one exists, only do so while the exact search is fast enough
+  outcomes = run_pipeline_over_profiles(pool, n, utility_func, NUM_RANDOM_SAMPLES, STAGES, NUM_PARALLEL_RUNS, n < MAX_N_TO_EXACT_CHECK, PARALLEL_PROFILES, batched_sa=BATCHED_SA)
+  for found_at_stage, stable_exists in outcomes:
+    #recovered stable match from simply running SA
+    if(found_at_stage == 0):
+      if(debug):
+        print("Found a stable arrangement after initial SA. Max welfare arrangement is stable.")
+      num_times_recovered += 1
+      num_times_found_after_initial_SA += 1
 
-      #after swapping blocking pairs, found a stable arrangement
-      else:
-        if(debug):
-          print("Found a stable arrangement after initial swapping blocking pairs.")
-        num_times_recovered += 1
+    #after swapping blocking pairs, found a stable arrangement
+    elif(found_at_stage == 1):
+      if(debug):
+        print("Found a stable arrangement after initial swapping blocking pairs.")
+      num_times_recovered += 1
+      num_times_found_after_swapping_pairs += 1
 
-    #recovered stable match from simply running SA
+    #after swapping blocking pairs, did not find a stable arrangement
     else:
       if(debug):
-          print("Found a stable arrangement after initial SA. Max welfare arrangement is stable.")
-      num_times_recovered += 1
+        print("No stable arrangement found after SA + blocking pairs.")
+
+      if(stable_exists == True):
+        num_times_not_recovered_but_stable_solution += 1
+      elif(stable_exists == False):
+        num_times_not_recovered_bc_no_stable_solution += 1
+      elif(n < MAX_N_TO_EXACT_CHECK):
+        num_times_not_recovered_unknown += 1
 
   print("Percentage Recovered:", num_times_recovered/NUM_RANDOM_SAMPLES)
   if(num_times_recovered > 0):
     print("Percentage of Recovered Found After Initial SA:", num_times_found_after_initial_SA/num_times_recovered)
     print("Percentage of Recovered Found After Swapping Blocking Pairs:", num_times_found_after_swapping_pairs/num_times_recovered)
 
-  if(n < MAX_N_TO_BRUTE_FORCE_CHECK):
+  if(n < MAX_N_TO_EXACT_CHECK):
     print("Percentage Not Recovered (No Stable Solution Exists):", num_times_not_recovered_bc_no_stable_solution/NUM_RANDOM_SAMPLES)
     print("Percentage Not Recovered (Stable Solution Exists):", num_times_not_recovered_but_stable_solution/NUM_RANDOM_SAMPLES)
+    print("Percentage Not Recovered (Unknown, Exact Search Gave Up):", num_times_not_recovered_unknown/NUM_RANDOM_SAMPLES)
 
 def main():   
     random.seed(GLOBAL_SEED)
@@ -103,17 +73,19 @@ def main():
         (ranking_to_binary_utility, "binary")
     ]
 
-    for n in range(4, 21):
-      print("="*80)
-      print(f"n={n}")
-      print("\n")
-
-      for utility_func, utility_name in utility_functions:
-          print(f"{utility_name}")
-          analyze_simulated_annealing_swapping_blocking_pairs_accuracy(n, utility_func, utility_name, NUM_SAMPLES)
-          print("-"*80)
+    #one pool for the whole sweep, reused by every profile
+    with create_solver_pool(cpu_count() if PARALLEL_PROFILES else min(NUM_PARALLEL_RUNS, cpu_count())) as pool:
+        for n in range(4, 21):
+          print("="*80)
+          print(f"n={n}")
+          print("\n")
+
+          for utility_func, utility_name in utility_functions:
+              print(f"{utility_name}")
+              analyze_simulated_annealing_swapping_blocking_pairs_accuracy(n, utility_func, utility_name, pool, NUM_SAMPLES)
+              print("-"*80)
       
-      print("="*80)
+          print("="*80)
       
 if __name__ == "__main__":
     main()
\ No newline at end of file
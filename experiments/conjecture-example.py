@@ -19,20 +19,18 @@ def generate_basic_ranking_for_person(person, people):
 
 def main():
     n = 5
-    people = [excel_label(i) for i in range(n)]
+    people = list(range(n))
 
     rankings = {person: generate_basic_ranking_for_person(person, people) for person in people}
     profile = generate_utilities(rankings, ranking_to_binary_utility, n)
 
-    arrangements = get_circular_arrangements(people)
-    max_welfare = -1
-
-    for a in arrangements:
-      welfare = calculate_total_utility(profile, a)
-      max_welfare = max(max_welfare, welfare)
+    #welfare of every arrangement at once
+    arrangements = arrangement_edge_ids(n)[0]
+    welfare = all_arrangement_welfare(profile)
 
+    for a, a_welfare in zip(arrangements.tolist(), welfare):
       if(is_stable(profile, a)):
-          print(a, welfare)
+          print(label_arrangement(a), a_welfare)
 
-    print("Maximum Possible Welfare:", max_welfare)
+    print("Maximum Possible Welfare:", welfare.max())
 main()
\ No newline at end of file
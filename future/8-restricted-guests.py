@@ -5,14 +5,26 @@ from utils import *
 from multiprocessing import Pool, cpu_count
 
 def main():
-    n = 8
+    random.seed(GLOBAL_SEED)
+
+    n = 2000
     k = 4
-    people = [excel_label(i) for i in range(n)] #[A,B,...,AA,...]
+    people = list(range(n)) #[0,1,...]
     classes = [_ for _ in range(k)] #[0,1,...]
 
     class_assignment = assign_people_to_classes(people, classes)
     class_ranking = generate_random_class_rankings(classes)
-    print(class_ranking_to_normalized_utility(people, class_assignment, class_ranking, n, k))
+    class_utilities = class_utility_table(class_ranking, k)
+    print(class_utilities)
+
+    #only the classes matter, so the search never needs the n x n profile
+    arrangement = find_stable_class_arrangement(people, class_assignment, class_utilities)
+    if(arrangement == None):
+        print("No stable arrangement found")
+    else:
+        profile = class_ranking_to_normalized_utility(people, class_assignment, class_ranking, n, k)
+        print("Stable arrangement found:", is_stable(profile, arrangement))
+        print([class_assignment[p] for p in arrangement[:40]], "...")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
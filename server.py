@@ -0,0 +1,263 @@
+""" Local seating service: POST a profile, get back a stable arrangement (if the pipeline finds one).
+
+  python server.py [--port 8765 | --unix /tmp/seating.sock] [--processes 4] [--batch-window-ms 5] [--max-batch 64]
+
+POST /solve   {"profile": n x n utilities}  or  {"rankings": [[guests ranked by guest 0], ...], "utility": "normalized"}
+              optional: "stages": ["max_sa", "swap", ...], "num_sa_runs": 10
+           -> {"stable": true, "arrangement": [...], "stage": "max_sa", "latency_ms": ..., "queue_depth": ..., "batch_size": ...}
+GET /stats -> request counts, latency percentiles, current queue depth and batches in flight
+
+Requests that arrive within batch-window-ms of each other (and have the same n, stages and number of SA runs)
+are solved together in one worker call, so their SA chains get annealed as one numpy batch.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+
+from utils import *
+
+DEFAULT_STAGES = [SA_MAX_STAGE, SWAP_STAGE]
+KNOWN_STAGES = {SA_MAX_STAGE, SA_MIN_STAGE, SWAP_STAGE, PT_MAX_STAGE, PT_MIN_STAGE, STABILITY_STAGE}
+NUM_LATENCIES_KEPT = 10_000 #for the percentiles in /stats
+
+class BadRequest(Exception):
+  pass
+
+def parse_solve_request(body):
+  """ Returns: (profile, stages, num_sa_runs) of a /solve request body. raises BadRequest"""
+  try:
+    request = json.loads(body)
+  except ValueError:
+    raise BadRequest("body is not JSON")
+  if(not isinstance(request, dict)):
+    raise BadRequest("body has to be a JSON object")
+
+  if("profile" in request):
+    try:
+      profile = np.array(request["profile"], dtype=float)
+    except (TypeError, ValueError):
+      raise BadRequest("profile has to be an n x n array of numbers")
+    if(profile.ndim != 2 or profile.shape[0] != profile.shape[1]):
+      raise BadRequest("profile has to be an n x n array of numbers")
+    #every comparison with NaN is false, a NaN profile would look stable
+    if(not np.isfinite(profile).all()):
+      raise BadRequest("profile has to be finite (no NaN or Infinity)")
+    profile = profile.copy()
+    np.fill_diagonal(profile, 0)
+
+  elif("rankings" in request):
+    utility_func = UTILITY_SCHEMES.get(request.get("utility", "normalized"))
+    if(utility_func == None):
+      raise BadRequest(f"utility has to be one of {sorted(UTILITY_SCHEMES)}")
+    rankings = request["rankings"]
+    n = len(rankings) if isinstance(rankings, list) else 0
+    others = [[o for o in range(n) if o != p] for p in range(n)]
+    if(n == 0 or any(
+      not isinstance(r, list) or any(type(o) != int for o in r) or sorted(r) != others[p]
+      for p, r in enumerate(rankings)
+    )):
+      raise BadRequest("rankings[p] has to rank every guest 0, ..., n-1 except p")
+    profile = generate_utilities(dict(enumerate(rankings)), utility_func, n)
+
+  else:
+    raise BadRequest("needs a profile or rankings")
+
+  if(len(profile) < 3):
+    raise BadRequest("needs at least 3 guests")
+
+  stages = request.get("stages", DEFAULT_STAGES)
+  if(not isinstance(stages, list) or any(stage not in KNOWN_STAGES for stage in stages)):
+    raise BadRequest(f"stages have to be a list of {sorted(KNOWN_STAGES)}")
+
+  num_sa_runs = request.get("num_sa_runs", 10)
+  if(type(num_sa_runs) != int or not 1 <= num_sa_runs <= 1000):
+    raise BadRequest("num_sa_runs has to be an integer between 1 and 1000")
+
+  return profile, stages, num_sa_runs
+
+class SeatingServer:
+  """ Queues /solve requests, groups the ones that can share a worker call and sends them to the pool.
+  Batches don't wait for each other: up to one per worker is in flight at a time"""
+
+  def __init__(self, pool, num_processes, batch_window, max_batch):
+    self.pool = pool
+    self.batch_window = batch_window
+    self.max_batch = max_batch
+    self.queue = asyncio.Queue()
+    self.workers_free = asyncio.Semaphore(num_processes)
+
+    self.queue_depth = 0 #requests waiting for or being solved
+    self.batches_in_flight = 0
+    self.num_requests = 0
+    self.num_stable = 0
+    self.num_errors = 0
+    self.latencies = deque(maxlen=NUM_LATENCIES_KEPT)
+    self.batch_sizes = deque(maxlen=NUM_LATENCIES_KEPT)
+
+  async def solve(self, profile, stages, num_sa_runs):
+    """ Returns: response for one request, once its batch is done"""
+    arrival = time.perf_counter()
+    queue_depth = self.queue_depth
+    self.queue_depth += 1
+
+    future = asyncio.get_running_loop().create_future()
+    await self.queue.put((profile, stages, num_sa_runs, future))
+    try:
+      (stage_idx, arrangement), batch_size = await future
+    finally:
+      self.queue_depth -= 1
+
+    latency = time.perf_counter() - arrival
+    self.num_requests += 1
+    self.num_stable += arrangement != None
+    self.latencies.append(latency)
+    return {
+      "stable": arrangement != None,
+      "arrangement": None if arrangement == None else list(arrangement),
+      "stage": None if stage_idx == None else stages[stage_idx],
+      "latency_ms": round(1000*latency, 3),
+      "queue_depth": queue_depth,
+      "batch_size": batch_size,
+    }
+
+  async def batch_requests(self):
+    #runs forever: take the oldest request, collect whatever else arrives within the batch window, dispatch
+    loop = asyncio.get_running_loop()
+    while True:
+      batch = [await self.queue.get()]
+      deadline = loop.time() + self.batch_window
+      while len(batch) < self.max_batch:
+        timeout = deadline - loop.time()
+        if(timeout <= 0):
+          break
+        try:
+          batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+        except asyncio.TimeoutError:
+          break
+
+      #profiles can only share a worker call if they have the same n, stages and SA runs
+      groups = {}
+      for request in batch:
+        profile, stages, num_sa_runs, future = request
+        groups.setdefault((len(profile), tuple(stages), num_sa_runs), []).append(request)
+
+      for (n, stages, num_sa_runs), requests in groups.items():
+        await self.workers_free.acquire()
+        loop.create_task(self.run_batch(list(stages), num_sa_runs, requests))
+
+  async def run_batch(self, stages, num_sa_runs, requests):
+    loop = asyncio.get_running_loop()
+    self.batches_in_flight += 1
+    self.batch_sizes.append(len(requests))
+    try:
+      done = loop.create_future()
+      args = ([profile for profile, _, _, _ in requests], stages, num_sa_runs, random.randrange(2**32))
+      self.pool.apply_async(
+        solve_profile_batch, (args,),
+        callback=lambda result: loop.call_soon_threadsafe(done.set_result, result),
+        error_callback=lambda e: loop.call_soon_threadsafe(done.set_exception, e),
+      )
+      try:
+        results = await done
+      except Exception as e:
+        self.num_errors += len(requests)
+        for _, _, _, future in requests:
+          future.set_exception(e)
+        return
+
+      for (_, _, _, future), result in zip(requests, results):
+        future.set_result((result, len(requests)))
+    finally:
+      self.batches_in_flight -= 1
+      self.workers_free.release()
+
+  def stats(self):
+    latencies = sorted(self.latencies)
+    def percentile(q):
+      return round(1000*latencies[min(len(latencies)-1, int(q*len(latencies)))], 3) if latencies else None
+
+    return {
+      "requests": self.num_requests,
+      "stable": self.num_stable,
+      "errors": self.num_errors,
+      "queue_depth": self.queue_depth,
+      "batches_in_flight": self.batches_in_flight,
+      "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": percentile(1.0)},
+      "mean_batch_size": round(sum(self.batch_sizes)/len(self.batch_sizes), 2) if self.batch_sizes else None,
+    }
+
+  async def handle_connection(self, reader, writer):
+    #minimal HTTP/1.1: one request per connection
+    try:
+      request_line = (await reader.readline()).decode("latin-1").split()
+      headers = {}
+      while (line := (await reader.readline()).decode("latin-1").strip()):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+      if(len(request_line) < 2):
+        status, response = 400, {"error": "bad request line"}
+      elif(request_line[:2] == ["GET", "/stats"]):
+        status, response = 200, self.stats()
+      elif(request_line[:2] == ["POST", "/solve"]):
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        try:
+          status, response = 200, await self.solve(*parse_solve_request(body))
+        except BadRequest as e:
+          status, response = 400, {"error": str(e)}
+        except Exception as e:
+          status, response = 500, {"error": repr(e)}
+      else:
+        status, response = 404, {"error": "try POST /solve or GET /stats"}
+
+      body = json.dumps(response).encode()
+      reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+      writer.write(
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+      )
+      await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+      pass
+    finally:
+      writer.close()
+
+async def serve(args):
+  with create_solver_pool(args.processes) as pool:
+    server = SeatingServer(pool, args.processes, args.batch_window_ms / 1000, args.max_batch)
+    batcher = asyncio.create_task(server.batch_requests())
+
+    if(args.unix):
+      listener = await asyncio.start_unix_server(server.handle_connection, path=args.unix)
+      print(f"Serving on unix:{args.unix} with {args.processes} processes", flush=True)
+    else:
+      listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+      print(f"Serving on http://{args.host}:{args.port} with {args.processes} processes", flush=True)
+
+    async with listener:
+      try:
+        await listener.serve_forever()
+      finally:
+        batcher.cancel()
+
+def main():
+  parser = argparse.ArgumentParser(description="Local seating service")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8765)
+  parser.add_argument("--unix", help="serve on this unix socket instead of host:port")
+  parser.add_argument("--processes", type=int, default=cpu_count())
+  parser.add_argument("--batch-window-ms", type=float, default=5.0, help="how long a request waits for others to batch with")
+  parser.add_argument("--max-batch", type=int, default=SA_BATCH_PROFILES)
+  args = parser.parse_args()
+
+  random.seed(GLOBAL_SEED)
+  try:
+    asyncio.run(serve(args))
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,180 @@
+""" Runs a whole experiment grid (every n x utility scheme cell) on one process pool.
+
+  python sweep.py sweeps/5-basic-SA-with-swapping.json [--n-range 4 12] [--samples 1000] [--processes 8] [--out results.jsonl]
+
+A sweep spec is a JSON object, every key optional (defaults in DEFAULT_SPEC), command line flags override it:
+  {"n_range": [4, 21], "utilities": ["normalized", "harmonic", "binary"], "samples": 100,
+   "stages": ["max_sa", "swap"], "num_sa_runs": 10, "exact_check_below": 17, "batched_sa": true,
+   "processes": null, "seed": 5}
+
+All the profile ranges of all the cells go into the pool at once, smallest n first, so cores never sit idle
+between cells and results of small cells come out while the big ones are still running.
+Every cell is printed (and written to --out as a JSON line) as soon as its last profile is done.
+Outcomes are the same as running the cell with run_pipeline_over_profiles (same seed and batched_sa).
+"""
+import argparse
+import json
+import queue
+import time
+
+from utils import *
+
+DEFAULT_SPEC = {
+  "n_range": [4, 21], #range(start, stop) of n
+  "utilities": ["normalized", "harmonic", "binary"], #keys of UTILITY_SCHEMES
+  "samples": 100, #random profiles per cell
+  "stages": [SA_MAX_STAGE, SWAP_STAGE],
+  "num_sa_runs": 10,
+  "exact_check_below": 17, #check whether a stable arrangement exists for unrecovered profiles with n below this (up to EXACT_CHECK_MAX_NODES)
+  "batched_sa": True,
+  "processes": None, #cpu_count()
+  "seed": GLOBAL_SEED,
+}
+
+def load_spec(path=None, overrides={}):
+  """ Returns: sweep spec from the JSON file at path (if any) with overrides applied on top of it. raises ValueError"""
+  spec = dict(DEFAULT_SPEC)
+  if(path != None):
+    with open(path) as f:
+      spec.update(json.load(f))
+  spec.update({key: value for key, value in overrides.items() if value != None})
+
+  unknown = set(spec) - set(DEFAULT_SPEC)
+  if(unknown):
+    raise ValueError(f"unknown sweep spec keys {sorted(unknown)}")
+  if(any(name not in UTILITY_SCHEMES for name in spec["utilities"])):
+    raise ValueError(f"utilities have to be in {sorted(UTILITY_SCHEMES)}")
+  known_stages = {SA_MAX_STAGE, SA_MIN_STAGE, SWAP_STAGE, PT_MAX_STAGE, PT_MIN_STAGE, STABILITY_STAGE}
+  if(any(stage not in known_stages for stage in spec["stages"])):
+    raise ValueError(f"stages have to be in {sorted(known_stages)}")
+  if(spec["n_range"][0] < 3):
+    raise ValueError("n has to be at least 3")
+  for key in ("samples", "num_sa_runs"):
+    if(not isinstance(spec[key], int) or isinstance(spec[key], bool) or spec[key] < 1):
+      raise ValueError(f"{key} has to be a positive integer")
+  return spec
+
+def sweep_cells(spec):
+  """ Returns: (n, utility name) of every cell, in the order they get scheduled: smallest (cheapest) n first"""
+  return [(n, name) for n in range(*spec["n_range"]) for name in spec["utilities"]]
+
+def run_sweep(spec, pool, num_processes):
+  """ Yields: (n, utility name, outcomes of its samples, seconds since the sweep started) for every cell, as soon as it is done"""
+  start_time = time.perf_counter()
+  sa_block = sa_block_size(spec["samples"]) if spec["batched_sa"] else 0
+  done = queue.Queue() #(cell, outcomes) from the pool's result thread
+
+  #submit everything up front: the pool hands tasks to workers in submission order, i.e. small cells first
+  cells = sweep_cells(spec)
+  num_pending_tasks = {}
+  for cell in cells:
+    n, name = cell
+    ranges = split_index_range(spec["samples"], num_processes, max(1, sa_block))
+    if(len(ranges) == 0):
+      #nothing to run, nothing would ever come back for it
+      yield n, name, [], time.perf_counter() - start_time
+      continue
+    num_pending_tasks[cell] = len(ranges)
+    for start, stop in ranges:
+      task = (n, UTILITY_SCHEMES[name], start, stop, spec["stages"], spec["num_sa_runs"], n < spec["exact_check_below"], spec["seed"], sa_block)
+      pool.apply_async(
+        run_pipeline_for_index_range, (task,),
+        callback=lambda outcomes, cell=cell: done.put((cell, outcomes)),
+        error_callback=lambda e, cell=cell: done.put((cell, e)),
+      )
+
+  outcomes = {cell: [] for cell in num_pending_tasks}
+  while num_pending_tasks:
+    cell, result = done.get()
+    if(isinstance(result, Exception)):
+      raise result
+    outcomes[cell] += result
+    num_pending_tasks[cell] -= 1
+    if(num_pending_tasks[cell] == 0):
+      del num_pending_tasks[cell]
+      yield cell[0], cell[1], outcomes.pop(cell), time.perf_counter() - start_time
+
+def summarize_cell(n, utility_name, outcomes, stages, seconds, exact_checked):
+  """ Returns: JSON-able summary of one cell, counts of where the stable arrangements were found"""
+  found_at_stage = [0] * len(stages)
+  not_recovered_stable_exists = 0
+  not_recovered_no_stable = 0
+  not_recovered_unknown = 0 #exact search gave up
+  for stage_idx, stable_exists in outcomes:
+    if(stage_idx != None):
+      found_at_stage[stage_idx] += 1
+    elif(stable_exists == True):
+      not_recovered_stable_exists += 1
+    elif(stable_exists == False):
+      not_recovered_no_stable += 1
+    elif(exact_checked):
+      not_recovered_unknown += 1
+
+  return {
+    "n": n,
+    "utility": utility_name,
+    "samples": len(outcomes),
+    "stages": stages,
+    "recovered": sum(found_at_stage),
+    "found_at_stage": found_at_stage,
+    "not_recovered_stable_exists": not_recovered_stable_exists,
+    "not_recovered_no_stable": not_recovered_no_stable,
+    "not_recovered_unknown": not_recovered_unknown,
+    "seconds": round(seconds, 3),
+  }
+
+def print_cell(summary, exact_checked):
+  samples = summary["samples"]
+  recovered = summary["recovered"]
+  print(f"n={summary['n']} {summary['utility']} ({summary['seconds']}s)")
+  if(samples == 0):
+    print("No samples")
+    print("-"*80, flush=True)
+    return
+  print("Percentage Recovered:", recovered/samples)
+  if(recovered > 0):
+    for stage_idx, (stage, count) in enumerate(zip(summary["stages"], summary["found_at_stage"])):
+      print(f"Percentage of Recovered Found After Stage {stage_idx} ({stage}):", count/recovered)
+  if(exact_checked):
+    print("Percentage Not Recovered (No Stable Solution Exists):", summary["not_recovered_no_stable"]/samples)
+    print("Percentage Not Recovered (Stable Solution Exists):", summary["not_recovered_stable_exists"]/samples)
+    print("Percentage Not Recovered (Unknown, Exact Search Gave Up):", summary["not_recovered_unknown"]/samples)
+  print("-"*80, flush=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Run an n x utility scheme grid of the recovery pipeline on one process pool")
+  parser.add_argument("spec", nargs="?", help="JSON sweep spec, see DEFAULT_SPEC")
+  parser.add_argument("--n-range", type=int, nargs=2, metavar=("START", "STOP"))
+  parser.add_argument("--utilities", nargs="+")
+  parser.add_argument("--samples", type=int)
+  parser.add_argument("--stages", nargs="+")
+  parser.add_argument("--num-sa-runs", type=int)
+  parser.add_argument("--processes", type=int)
+  parser.add_argument("--seed", type=int)
+  parser.add_argument("--out", help="append a JSON line per finished cell to this file")
+  args = parser.parse_args()
+
+  overrides = {key: getattr(args, key) for key in ("n_range", "utilities", "samples", "stages", "num_sa_runs", "processes", "seed")}
+  try:
+    spec = load_spec(args.spec, overrides)
+  except ValueError as e:
+    parser.error(str(e))
+
+  random.seed(spec["seed"])
+  num_processes = spec["processes"] or cpu_count()
+  out = open(args.out, "a") if args.out else None
+
+  with create_solver_pool(num_processes) as pool:
+    for n, utility_name, outcomes, seconds in run_sweep(spec, pool, num_processes):
+      exact_checked = n < spec["exact_check_below"]
+      summary = summarize_cell(n, utility_name, outcomes, spec["stages"], seconds, exact_checked)
+      print_cell(summary, exact_checked)
+      if(out != None):
+        out.write(json.dumps(summary) + "\n")
+        out.flush()
+
+  if(out != None):
+    out.close()
+
+if __name__ == "__main__":
+  main()
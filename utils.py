@@ -1,8 +1,15 @@
 import itertools
 import random
 import math
+import functools
+import os
+
+import numpy as np
+from multiprocessing import cpu_count, shared_memory
+from multiprocessing.pool import Pool as ProcessPool
 
 GLOBAL_SEED = 5 #global for reproducibility
+WELFARE_TOL = 1e-9 #welfare differences below this are floating point noise (e.g. two equally good arrangements)
 
 def excel_label(i):
   #A, B, ..., Z, AA, ...
@@ -15,6 +22,10 @@ def excel_label(i):
     i -= 1
   return s
 
+def label_arrangement(arrangement):
+  #integer guest ids -> excel labels, only used when printing
+  return tuple(excel_label(p) for p in arrangement)
+
 def assign_people_to_classes(people, classes):
   class_assignment = {}
   for p in people:
@@ -25,23 +36,35 @@ def assign_people_to_classes(people, classes):
 # NOTE: there (n-1)!/2 arrangements
 # (n-1)! for sliding (explanation: https://www.youtube.com/watch?v=TgJMVLSjpOc)
 # divide by 2 for cw/ccw
-def get_circular_arrangements(people):
-    arrangements = set()
-    for p in itertools.permutations(people):
-      # only add topologically different arrangements
-      # e.g. ('A', 'C', 'B') == ('B', 'A', 'C') if you slide to the left or right enough
-      # e.g. ('A', 'C', 'B') == ('A', 'B', 'C'). one is clockwise, the other counterclockwise
-      rotations = [p[i:] + p[:i] for i in range(len(p))]
-
-      p_reversed = p[::-1]
-      reversed_rotations = [p_reversed[i:] + p_reversed[:i] for i in range(len(p))]
-
-      #lexographically smallest
-      #we get every rotation of both the original (clockwise) and reversed (ccw) permutation.
-      #min = pick the permutation rotation that starts with 'A'
-      arrangements.add(min(rotations + reversed_rotations))
+# NOTE: generator, so the arrangements never all have to sit in memory
+def iter_circular_arrangements(people):
+  # only yield topologically different arrangements, each exactly once
+  # e.g. ('A', 'C', 'B') == ('B', 'A', 'C') if you slide to the left or right enough
+  #   -> the first person always sits in seat 0
+  # e.g. ('A', 'C', 'B') == ('A', 'B', 'C'). one is clockwise, the other counterclockwise
+  #   -> the person in seat 1 comes before the person in the last seat
+  first, rest = people[0], people[1:]
+  if(len(rest) < 2):
+    yield tuple(people)
+    return
+
+  for second, last in itertools.combinations(rest, 2):
+    middle = [p for p in rest if p != second and p != last]
+    for p in itertools.permutations(middle):
+      yield (first, second) + p + (last,)
+
+def canonical_arrangement(arrangement):
+  """ Returns: the same table in the form iter_circular_arrangements yields it for sorted people
+  (rotated so the smallest guest sits in seat 0, mirrored so seat 1 < last seat)"""
+  arrangement = tuple(arrangement)
+  k = arrangement.index(min(arrangement))
+  arrangement = arrangement[k:] + arrangement[:k]
+  if(len(arrangement) > 2 and arrangement[1] > arrangement[-1]):
+    arrangement = arrangement[:1] + arrangement[:0:-1]
+  return arrangement
 
-    return list(arrangements)
+def get_circular_arrangements(people):
+  return list(iter_circular_arrangements(people))
 
 def generate_random_arrangement(people):
   people_copy = people.copy()
@@ -65,13 +88,112 @@ def generate_all_rankings(people):
     #output: {'A': ('B', 'C'), 'B': ('A', 'C'), 'C': ('A', 'B')}
     #s.t. A: B > C, B: A > C, C: A > B
 
-def generate_random_ranking_for_person(person, people):
+def generate_random_ranking_for_person(person, people, rng=random):
   others = [o for o in people if o != person]
-  random.shuffle(others)
+  rng.shuffle(others)
   return tuple(others)
 
-def generate_random_rankings(people):
-  return {person: generate_random_ranking_for_person(person, people) for person in people}
+def generate_random_rankings(people, rng=random):
+  return {person: generate_random_ranking_for_person(person, people, rng) for person in people}
+
+# NOTE: profiles can be made straight from their index in a sample (or in generate_all_rankings),
+# so workers can generate their own profiles from an index range and nothing has to be materialized or pickled
+def num_ranking_profiles(n):
+  #every person has (n-1)! possible rankings
+  return math.factorial(n-1)**n
+
+def unrank_permutation(items, index):
+  #index-th permutation of items, in itertools.permutations order (factorial number system)
+  items = list(items)
+  perm = []
+  for i in range(len(items), 0, -1):
+    digit, index = divmod(index, math.factorial(i-1))
+    perm.append(items.pop(digit))
+  return tuple(perm)
+
+def unrank_rankings(people, index):
+  #index-th profile of generate_all_rankings(people), without generating the ones before it
+  #mixed radix: every person is a digit with (n-1)! values, the last person changes fastest
+  num_rankings = math.factorial(len(people)-1)
+  rankings = {}
+  for person in reversed(people):
+    index, r = divmod(index, num_rankings)
+    rankings[person] = unrank_permutation([o for o in people if o != person], r)
+
+  return {person: rankings[person] for person in people}
+
+def get_ranking_profile(people, index, exhaustive=False, seed=GLOBAL_SEED):
+  """ Returns: the index-th ranking profile. exhaustive: index into generate_all_rankings(people),
+  otherwise a random profile that only depends on (seed, index)"""
+  if(exhaustive):
+    return unrank_rankings(people, index)
+  return generate_random_rankings(people, random.Random(f"{seed}:{index}"))
+
+def iter_ranking_profiles(people, start, stop, exhaustive=False, seed=GLOBAL_SEED):
+  for index in range(start, stop):
+    yield get_ranking_profile(people, index, exhaustive, seed)
+
+# NOTE: relabeling the guests of a profile doesn't change anything about its stability or welfare.
+# every profile can be relabeled so that guest 0 ranks 1, 2, ..., n-1 in order, and those profiles are exactly
+# indices 0, ..., (n-1)!^(n-1) - 1 of generate_all_rankings (guest 0 is the most significant digit).
+# for each of them, making guest q the new guest 0 gives n relabelings that stay in that index range:
+# the profile represents its relabeling orbit if it has the smallest index of them all
+def num_relabeled_ranking_profiles(n):
+  #profiles where guest 0 ranks 1, 2, ..., n-1 in order: every relabeling orbit has at least one
+  return math.factorial(n-1)**(n-1)
+
+def permutation_ranks(perms):
+  #... x m array of permutations of 0, ..., m-1 -> their indices in itertools.permutations order (Lehmer code)
+  m = perms.shape[-1]
+  smaller_after = (perms[..., None, :] < perms[..., :, None]) & np.triu(np.ones((m, m), dtype=bool), 1)
+  weights = np.array([math.factorial(m-1-i) for i in range(m)])
+  return smaller_after.sum(axis=-1) @ weights
+
+def ranking_arrays_to_indices(rankings):
+  """ rankings: B x n x (n-1) ranking arrays
+  Returns: their indices in generate_all_rankings order"""
+  n = rankings.shape[1]
+  positions = rankings - (rankings > np.arange(n)[:, None]) #position of everyone among p's others
+  digits = permutation_ranks(positions)
+  return digits @ (math.factorial(n-1) ** np.arange(n-1, -1, -1, dtype=np.int64))
+
+def iter_ranking_profile_orbits(n, start=0, stop=None, batch_size=4096):
+  """ Yields: (index, orbit size) for the profiles in generate_all_rankings that represent their relabeling orbit,
+  looking at indices start, ..., stop-1 of the first num_relabeled_ranking_profiles(n).
+  the orbit sizes add up to num_ranking_profiles(n)"""
+  stop = num_relabeled_ranking_profiles(n) if stop == None else stop
+  num_rankings = math.factorial(n-1)
+  perms = np.array(list(itertools.permutations(range(n-1))))
+  others = np.array([[o for o in range(n) if o != p] for p in range(n)])
+
+  for batch_start in range(start, stop, batch_size):
+    indices = np.arange(batch_start, min(batch_start + batch_size, stop), dtype=np.int64)
+    rows = np.arange(len(indices))
+
+    #unrank: guest n-1 is the least significant digit
+    rankings = np.empty((len(indices), n, n-1), dtype=np.int64)
+    rest = indices.copy()
+    for p in range(n-1, -1, -1):
+      rest, digit = np.divmod(rest, num_rankings)
+      rankings[:, p] = others[p][perms[digit]]
+
+    smallest = indices.copy()
+    num_automorphisms = np.zeros(len(indices), dtype=np.int64)
+    for q in range(n):
+      #relabel: q -> 0, the guest q ranks i-th -> i+1
+      relabel = np.zeros((len(indices), n), dtype=np.int64)
+      np.put_along_axis(relabel, rankings[:, q], np.arange(1, n), axis=1)
+
+      relabeled = np.empty_like(rankings)
+      relabeled[rows[:, None], relabel] = relabel[rows[:, None, None], rankings]
+      relabeled_indices = ranking_arrays_to_indices(relabeled)
+
+      smallest = np.minimum(smallest, relabeled_indices)
+      num_automorphisms += relabeled_indices == indices
+
+    orbit_sizes = math.factorial(n) // num_automorphisms
+    for k in np.flatnonzero(smallest == indices):
+      yield int(indices[k]), int(orbit_sizes[k])
 
 def generate_random_class_ranking_for_class(classes):
   #NOTE: every class gets to rank itself as well (e.g. people in class 3 like sitting next to others in class 3 most)
@@ -82,6 +204,11 @@ def generate_random_class_ranking_for_class(classes):
 def generate_random_class_rankings(classes):
   return {c: generate_random_class_ranking_for_class(classes) for c in classes} #{0: (2,3,1,0), 1: (2,0,3,1), ...}
 
+# NOTE: a profile is an n x n float array over integer guest ids 0, ..., n-1
+# profile[p][o] = utility p gets from sitting next to o (the diagonal is unused and stays 0)
+def new_profile(n):
+  return np.zeros((n, n))
+
 # rankings -> utility
 def ranking_to_normalized_utility(ordering, n):
   n_others = n-1
@@ -125,26 +252,78 @@ def ranking_to_skewed_utility(ordering, n):
   return {person: score[i] for i, person in enumerate(ordering)}
   
 
-def class_ranking_to_normalized_utility(people, class_assignment, class_ranking, n, k):
+def class_utility_table(class_ranking, k):
+  """ Returns: k x k array, table[c][d] = utility a guest in class c gets from sitting next to a guest in class d"""
   total = (k-1)*k/2 #each class ranks the other k-1 classes w utility: k-1, k-2, ..., 1
+  table = np.zeros((k, k))
+  for c, ranking in class_ranking.items():
+    table[c, list(ranking)] = (k-1-np.arange(k))/total #ranking index (0 = 1st place, 1 = 2nd place, etc.)
+  return table
 
-  profile = {}
-  for p in people:
-    profile[p] = {}
-
-    p_class = class_assignment[p]
-    p_class_ranking = class_ranking[p_class]
+def class_ranking_to_normalized_utility(people, class_assignment, class_ranking, n, k):
+  #every guest pair gets the utility of their classes: table[class of p][class of o]
+  table = class_utility_table(class_ranking, k)
+  classes = np.array([class_assignment[p] for p in people])
 
-    for o in people:
-      if(p != o):
-        o_class = class_assignment[o]
-        rank = p_class_ranking.index(o_class) #ranking index (0 = 1st place, 1 = 2nd place, etc.)
-        profile[p][o] = (k-1-rank)/total #utility
+  profile = new_profile(n)
+  profile[np.ix_(people, people)] = table[classes[:, None], classes[None, :]]
+  np.fill_diagonal(profile, 0)
 
   return profile
 
+# utility schemes by name. every scheme only depends on ranking positions, so its
+# scores are computed once per n (rank_scores) and profiles are built by gathering from them
+UTILITY_SCHEMES = {
+  "normalized": ranking_to_normalized_utility,
+  "harmonic": ranking_to_harmonic_utility,
+  "binary": ranking_to_binary_utility,
+  "negative": ranking_to_normalized_negative_utility,
+  "binary_negative": ranking_to_binary_negative_utility,
+  "skewed": ranking_to_skewed_utility,
+}
+
+@functools.lru_cache(maxsize=None)
+def rank_scores(utility_func, n):
+  """ Returns: read-only length n array, utility of the guest ranked at each position (and 0 for yourself at position n-1)"""
+  utility = utility_func(tuple(range(n-1)), n)
+  scores = np.array([utility[i] for i in range(n-1)] + [0.0])
+  scores.flags.writeable = False
+  return scores
+
 def generate_utilities(rankings, utility_func, n):
-  return {person: utility_func(ranking, n) for person, ranking in rankings.items()}
+  scores = rank_scores(utility_func, n)[:n-1]
+  profile = new_profile(n)
+
+  #one gather for the whole profile: row person, column whoever person ranks k-th gets scores[k]
+  persons = list(rankings)
+  others = [o for person in persons for o in rankings[person]]
+  profile[np.repeat(persons, n-1), others] = np.tile(scores, len(persons))
+
+  return profile
+
+# NOTE: batches of random profiles as arrays, for when profiles are needed by the million.
+# rankings[b][p] = p's ranking of the others (best first), ranks[b][p][o] = o's position in it (p itself gets n-1).
+# a profile is then a lookup of ranks in the scheme's rank_scores
+def generate_random_ranking_arrays(num_profiles, n, rng):
+  """ Returns: (rankings, ranks). num_profiles x n x (n-1) and num_profiles x n x n integer arrays"""
+  keys = rng.random((num_profiles, n, n))
+  keys[:, np.arange(n), np.arange(n)] = np.inf #everyone ranks themself last
+  order = keys.argsort(axis=2)
+
+  ranks = np.empty_like(order)
+  np.put_along_axis(ranks, order, np.arange(n), axis=2)
+  return order[:, :, :n-1], ranks
+
+def generate_utilities_batch(ranks, utility_func):
+  """ Returns: one profile per ranking profile in ranks (... x n x n inverse rank arrays), same as generate_utilities"""
+  return rank_scores(utility_func, ranks.shape[-1])[ranks]
+
+def iter_random_profile_batches(n, utility_func, num_profiles, batch_size=10_000, seed=GLOBAL_SEED):
+  """ Yields: (rankings, ranks, profiles) for num_profiles random profiles, batch_size at a time"""
+  rng = np.random.default_rng(seed)
+  for start in range(0, num_profiles, batch_size):
+    rankings, ranks = generate_random_ranking_arrays(min(batch_size, num_profiles - start), n, rng)
+    yield rankings, ranks, generate_utilities_batch(ranks, utility_func)
 
 def get_neighbors(arrangement, seat, idx=-1):
   #if you have the seat index already, pass it in the 'idx' parameter.
@@ -157,70 +336,341 @@ def get_neighbors(arrangement, seat, idx=-1):
   return [arrangement[i-1], arrangement[(i+1)%len(arrangement)]]
 
 def calculate_total_utility(profile, arrangement):
-  sum = 0
-
-  for seat in arrangement:
-    #check two neighbors
-    neighbors = get_neighbors(arrangement, seat)
-    sum += profile[seat][neighbors[0]] + profile[seat][neighbors[1]]
-
-  return sum
+  seats = np.asarray(arrangement)
+
+  #every seat gets utility from its left and right neighbor
+  return (profile[seats, np.roll(seats, 1)] + profile[seats, np.roll(seats, -1)]).sum()
+
+def max_welfare_arrangements(profile, findMax=True):
+  """ Exact welfare maximizer (or minimizer): max welfare on a cycle is a symmetric TSP over the edge weights
+  profile[p][o] + profile[o][p], solved with a Held-Karp bitmask DP. Guest 0 is fixed in seat 0.
+  Returns: (best total utility, generator of every optimal arrangement, each in canonical form)"""
+  n = len(profile)
+  sign = 1 if findMax else -1
+  W = sign * (profile + profile.T)
+  if(n < 4):
+    arr = tuple(range(n))
+    return sign * calculate_total_utility(sign * profile, arr), iter([arr])
+
+  #guest j+1 <-> bit j. dp[S][j] = best path from guest 0 through exactly the guests in S, ending at guest j+1
+  m = n-1
+  w = W[1:, 1:]
+  dp = np.full((1 << m, m), -np.inf)
+  bits = 1 << np.arange(m)
+  dp[bits, np.arange(m)] = W[0, 1:]
+
+  #fill subsets in order of size, a whole layer (and the guest added next) at a time
+  subsets = np.arange(1 << m)
+  sizes = np.zeros(1 << m, dtype=int)
+  for b in range(m):
+    sizes += (subsets >> b) & 1
+
+  CHUNK = 4096 #bounds the (subsets x m x m) temporary
+  for size in range(1, m):
+    layer = subsets[sizes == size]
+    for c in range(0, len(layer), CHUNK):
+      S = layer[c:c+CHUNK]
+      #best[s][k] = best path through S, then on to guest k+1
+      best = (dp[S][:, :, None] + w[None, :, :]).max(axis=1)
+      s_idx, k = np.nonzero((S[:, None] & bits[None, :]) == 0)
+      dp[S[s_idx] | bits[k], k] = best[s_idx, k]
+
+  full = (1 << m) - 1
+  closing = dp[full] + W[1:, 0]
+  best_welfare = closing.max()
+
+  def paths(S, j):
+    #every optimal path through S ending at guest j+1 (as bit indices)
+    prev_S = S ^ (1 << j)
+    if(prev_S == 0):
+      yield [j]
+      return
+    for i in np.flatnonzero(dp[prev_S] + w[:, j] >= dp[S, j] - WELFARE_TOL):
+      for path in paths(prev_S, int(i)):
+        yield path + [j]
+
+  def arrangements():
+    for j in np.flatnonzero(closing >= best_welfare - WELFARE_TOL):
+      for path in paths(full, int(j)):
+        #each table shows up once per direction, keep the canonical one
+        if(path[0] < path[-1]):
+          yield (0,) + tuple(p+1 for p in path)
+
+  return sign * best_welfare, arrangements()
+
+ARRANGEMENT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "arrangements")
+
+def arrangement_table(n):
+  """ Every canonical arrangement of guests 0, ..., n-1 (iter_circular_arrangements order) as a read-only
+  (n-1)!/2 x n uint8 array, memory-mapped from ARRANGEMENT_CACHE_DIR: enumerated once, then every process
+  (and every later run) shares the same pages"""
+  num_arrangements = max(1, math.factorial(n-1) // 2)
+  path = os.path.join(ARRANGEMENT_CACHE_DIR, f"arrangements-{n}.u8")
+
+  if(not os.path.exists(path) or os.path.getsize(path) != num_arrangements * n):
+    os.makedirs(ARRANGEMENT_CACHE_DIR, exist_ok=True)
+    table = np.fromiter(itertools.chain.from_iterable(iter_circular_arrangements(list(range(n)))), dtype=np.uint8, count=num_arrangements * n)
+
+    #write to a temporary file first, so other processes never see half a table
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table.tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+  return np.memmap(path, dtype=np.uint8, mode="r", shape=(num_arrangements, n))
+
+# NOTE: for small n every arrangement can just be scored, for many profiles at once.
+# each (canonical) arrangement is stored as the ids of its n edges (unordered guest pairs), so the welfare of
+# every arrangement is a gather from the profile's edge weights and a sum: an arrangement x edge incidence matrix product
+@functools.lru_cache(maxsize=None)
+def arrangement_edge_ids(n):
+  """ Returns: (A x n array of every canonical arrangement (arrangement_table(n)),
+               A x n array of their edge ids, edge k joins seats k and k+1). both read-only"""
+  arrangements = arrangement_table(n)
+  rows, cols = np.triu_indices(n, 1)
+  edge_id = np.zeros((n, n), dtype=np.uint8 if len(rows) <= 256 else np.int64)
+  edge_id[rows, cols] = edge_id[cols, rows] = np.arange(len(rows))
+  edge_ids = edge_id[arrangements, np.roll(arrangements, -1, axis=1)]
+
+  edge_ids.flags.writeable = False
+  return arrangements, edge_ids
+
+def all_arrangement_welfare(profiles):
+  """ profiles: n x n or B x n x n
+  Returns: total utility of every canonical arrangement (A, or B x A)"""
+  n = profiles.shape[-1]
+  rows, cols = np.triu_indices(n, 1)
+  edge_weights = profiles[..., rows, cols] + profiles[..., cols, rows]
+  return edge_weights[..., arrangement_edge_ids(n)[1]].sum(axis=-1)
+
+def max_welfare_arrangements_batch(profiles, findMax=True):
+  """ Same as max_welfare_arrangements for a B x n x n batch of profiles, by scoring every arrangement
+  (only for small n, there are (n-1)!/2 of them)
+  Returns: (B array of best total utilities, B x A boolean array marking the optimal arrangements of arrangement_edge_ids(n)[0])"""
+  welfare = all_arrangement_welfare(profiles)
+  if not findMax:
+    welfare = -welfare
+  best = welfare.max(axis=-1)
+  optimal = welfare >= best[..., None] - WELFARE_TOL
+  return (best if findMax else -best), optimal
+
+@functools.lru_cache(maxsize=None)
+def swap_index_arrays(n):
+  """ Returns: (left, right, fixes): left/right neighbor of every seat, and for swapping with the right/left neighbor
+  (seats, the neighbor's seat, seat of the guest that ends up on the other side)"""
+  idx = np.arange(n)
+  left, right = (idx - 1) % n, (idx + 1) % n
+  #guest in seat i moving one seat right ends up next to the guest from seat i+2 and the one it swapped with (seat i+1)
+  moves_right = (idx, right, (idx + 2) % n)
+  #moving one seat left: next to the guest from seat i-2 and the one from seat i-1
+  moves_left = (idx, left, (idx - 2) % n)
+  return left, right, (moves_right, moves_left)
+
+def blocking_pair_mask(profile, arrangement):
+  """ Returns: n x n boolean array, mask[i][j] is True if the guests in seats i and j are a blocking pair
+  (i.e. both would be strictly better off swapping seats)"""
+  return blocking_pair_masks(profile, np.asarray(arrangement)[None])[0]
+
+def blocking_pair_masks(profile, arrangements):
+  #blocking_pair_mask for every row of arrangements (B x n) at once: B x n x n
+  left, right, fixes = swap_index_arrays(arrangements.shape[1])
+
+  #u[b][i][j] = utility the guest in seat i gets from the guest in seat j
+  u = profile[arrangements[:, :, None], arrangements[:, None, :]]
+
+  #other_utility[b][i][j] = utility the guest in seat i would get in seat j. the diagonal is where they sit now
+  other_utility = u[:, :, left] + u[:, :, right]
+  curr_utility = other_utility.diagonal(axis1=1, axis2=2).copy()
+  for seat, neighbor, other_side in fixes:
+    #swapping two neighbors: the guest ends up next to the other guest (in its old seat) instead of next to itself
+    other_utility[:, seat, neighbor] = u[:, seat, other_side] + u[:, seat, neighbor]
+
+  #both players would benefit from swapping
+  would_swap = other_utility > curr_utility[:, :, None]
+  return would_swap & would_swap.transpose(0, 2, 1)
+
+def stable_arrangements_mask(profile, arrangements, chunk_size=4096):
+  """ arrangements: A x n array
+  Returns: length A boolean array, True for the stable arrangements. same as is_stable on every row, chunk_size rows at a time"""
+  arrangements = np.asarray(arrangements)
+  stable = np.zeros(len(arrangements), dtype=bool)
+  for start in range(0, len(arrangements), chunk_size):
+    stable[start:start+chunk_size] = ~blocking_pair_masks(profile, arrangements[start:start+chunk_size]).any(axis=(1, 2))
+  return stable
+
+def first_stable_arrangement(profile, arrangements, chunk_size=4096):
+  """ Same as stable_arrangements_mask, but stops at the first chunk with a stable arrangement
+  Returns: index of the first stable arrangement, or None"""
+  arrangements = np.asarray(arrangements)
+  for start in range(0, len(arrangements), chunk_size):
+    stable = ~blocking_pair_masks(profile, arrangements[start:start+chunk_size]).any(axis=(1, 2))
+    if(stable.any()):
+      return start + int(stable.argmax())
+  return None
 
 def find_blocking_pair(profile, arrangement):
-  for seat in arrangement:
-    neighbors = get_neighbors(arrangement, seat)
-    curr_utility = profile[seat][neighbors[0]] + profile[seat][neighbors[1]]
+  #first blocking pair, scanning seats in order
+  mask = blocking_pair_mask(profile, arrangement).ravel()
+  k = mask.argmax()
+  if(not mask[k]):
+    return None
 
-    for other in arrangement:
-      if(other != seat):
-        other_neighbors = get_neighbors(arrangement, other)
+  i, j = divmod(int(k), len(arrangement))
+  return [arrangement[i], arrangement[j]]
 
-        #swapping two neighbors
-        if(seat == other_neighbors[0]):
-          other_utility = profile[seat][other_neighbors[1]] + profile[seat][other]
-        elif(seat == other_neighbors[1]):
-          other_utility = profile[seat][other_neighbors[0]] + profile[seat][other]
-        else:
-          other_utility = profile[seat][other_neighbors[0]] + profile[seat][other_neighbors[1]]
+def is_stable(profile, arrangement):
+  return not blocking_pair_mask(profile, arrangement).any()
+
+def run_stability_search(profile, arrangement=None):
+  """ SA on the number of blocking pairs instead of on welfare, stops as soon as it reaches 0.
+  Half of the moves swap a random blocking pair (which both guests want), the other half swap two random seats
+  (so the search can get out of arrangements where every blocking pair swap makes things worse).
+  Metropolis acceptance: worse arrangements are accepted with probability exp(-(increase in blocking pairs)/T)
+  Returns: (arrangement with the fewest blocking pairs found (tuple), its number of blocking pairs). stable iff 0"""
+  n = len(profile)
+  MAX_ROUNDS = 200*n
+  T = 2
+  gamma = 0.9995
+
+  if(arrangement is None):
+    arrangement = generate_random_arrangement(list(range(n)))
+  arrangement = [int(guest) for guest in arrangement] #also takes numpy rows (e.g. from run_batched_simulated_annealing)
+  mask = blocking_pair_mask(profile, arrangement)
+  num_blocking_pairs = int(mask.sum()) // 2
+  best, best_num_blocking_pairs = tuple(arrangement), num_blocking_pairs
 
-        #player 1 would benefit from swapping
-        if(other_utility > curr_utility):
-          #check if player 2 would benefit from swapping
-          curr_utility2 = profile[other][other_neighbors[0]] + profile[other][other_neighbors[1]]
+  for k in range(MAX_ROUNDS):
+    if(num_blocking_pairs == 0):
+      break
 
-          if(other == neighbors[0]):
-            other_utility2 = profile[other][neighbors[1]] + profile[other][seat]
-          elif(other == neighbors[1]):
-            other_utility2 = profile[other][neighbors[0]] + profile[other][seat]
-          else:
-            other_utility2 = profile[other][neighbors[0]] + profile[other][neighbors[1]]
+    if(random.random() < 0.5):
+      blocking_pairs = np.argwhere(np.triu(mask))
+      i, j = blocking_pairs[random.randrange(len(blocking_pairs))]
+    else:
+      i, j = pick_seats_to_swap(n)
 
-          if(other_utility2 > curr_utility2):
-            return [seat, other]
-  return None
+    arrangement[i], arrangement[j] = arrangement[j], arrangement[i]
+    next_mask = blocking_pair_mask(profile, arrangement)
+    next_num_blocking_pairs = int(next_mask.sum()) // 2
 
-def is_stable(profile, arrangement):
-  blocking_pair = find_blocking_pair(profile, arrangement)
-  return blocking_pair == None
+    increase = next_num_blocking_pairs - num_blocking_pairs
+    if(increase <= 0 or random.random() < math.exp(-increase/T)):
+      mask, num_blocking_pairs = next_mask, next_num_blocking_pairs
+      if(num_blocking_pairs < best_num_blocking_pairs):
+        best, best_num_blocking_pairs = tuple(arrangement), num_blocking_pairs
+    else:
+      arrangement[i], arrangement[j] = arrangement[j], arrangement[i]
+
+    T *= gamma
 
-def does_stable_arr_exist_for_profile(people, profile):
-  all_arrangements = get_circular_arrangements(people)
+  return best, best_num_blocking_pairs
+
+MAX_N_TO_SCAN_ALL_ARRANGEMENTS = 7 #up to here, checking all (n-1)!/2 arrangements at once beats the branch and bound
+
+class SearchBudgetExceeded(Exception):
+  #find_stable_arrangement tried max_nodes partial tables without finding a stable arrangement or ruling one out
+  pass
+
+def find_stable_arrangement(people, profile, max_nodes=None):
+  """ Exact search: builds arrangements seat by seat (people[0] in seat 0, seat 1 before the last seat, same as
+  iter_circular_arrangements) and prunes any partial table that already has a blocking pair among guests
+  whose two neighbors are both seated. small tables just check every arrangement (first_stable_arrangement)
+  max_nodes: give up (SearchBudgetExceeded) after that many partial tables. ruling out a stable arrangement
+  means going through the whole tree, which has no useful bound in time past n=14 or so
+  Returns: a stable arrangement, or None if no stable arrangement exists"""
+  n = len(people)
+  if(n < 4):
+    #every arrangement is the same table
+    arr = tuple(people)
+    return arr if is_stable(profile, arr) else None
+
+  if(n <= MAX_N_TO_SCAN_ALL_ARRANGEMENTS):
+    arrangements = np.asarray(people)[arrangement_table(n)]
+    k = first_stable_arrangement(profile, arrangements)
+    return None if k == None else tuple(arrangements[k].tolist())
+
+  u = profile.tolist()
+  order = {p: i for i, p in enumerate(people)}
+  seats = [people[0]]
+  curr_utility = [0.0] * n #only filled in for seats 1, ..., len(seats)-2
+  remaining = set(people[1:])
+  num_nodes = 0
+
+  def blocks(i, j):
+    #i, j: seats that both have both neighbors seated
+    seat, other = seats[i], seats[j]
+    u_seat, u_other = u[seat], u[other]
+
+    #swapping two neighbors
+    if(j == i+1):
+      other_utility = u_seat[seats[j+1]] + u_seat[other]
+      other_utility2 = u_other[seats[i-1]] + u_other[seat]
+    elif(j == i-1):
+      other_utility = u_seat[seats[j-1]] + u_seat[other]
+      other_utility2 = u_other[seats[i+1]] + u_other[seat]
+    else:
+      other_utility = u_seat[seats[j-1]] + u_seat[seats[j+1]]
+      other_utility2 = u_other[seats[i-1]] + u_other[seats[i+1]]
+
+    return other_utility > curr_utility[i] and other_utility2 > curr_utility[j]
+
+  def search():
+    nonlocal num_nodes
+    num_nodes += 1
+    if(max_nodes != None and num_nodes > max_nodes):
+      raise SearchBudgetExceeded()
+
+    k = len(seats)
+    if(k >= 3):
+      #seat k-2 just got its second neighbor
+      m = k-2
+      curr_utility[m] = u[seats[m]][seats[m-1]] + u[seats[m]][seats[m+1]]
+      for j in range(1, m):
+        if(blocks(m, j)):
+          return None
+
+    if(k == n):
+      #only pairs involving the first and last seat are left to check
+      arr = tuple(seats)
+      return arr if is_stable(profile, arr) else None
+
+    for guest in sorted(remaining, key=order.get):
+      #seat 1 comes before the last seat (no cw/ccw duplicates)
+      if(k == n-1 and order[guest] < order[seats[1]]):
+        continue
+
+      seats.append(guest)
+      remaining.remove(guest)
+      found = search()
+      remaining.add(guest)
+      seats.pop()
+
+      if(found != None):
+        return found
+
+    return None
+
+  return search()
+
+def does_stable_arr_exist_for_profile(people, profile, max_nodes=None):
+  """ Returns: whether a stable arrangement exists, None if find_stable_arrangement couldn't tell within max_nodes"""
+  try:
+    return find_stable_arrangement(people, profile, max_nodes) != None
+  except SearchBudgetExceeded:
+    return None
+
+def pick_seats_to_swap(n):
+  """ Returns: two distinct seat indices"""
+  i = random.randrange(0, n)
+  j = random.randrange(0, n)
 
-  # stable_arrs = []
-  for arr in all_arrangements:
-    if(is_stable(profile, arr)):
-      return True
-      # stable_arrs.append(arr)
+  while i == j:
+    j = random.randrange(0, n)
 
-  return False
+  return i, j
 
 def swap_seats(prev_arrangement):
   """ Returns: an arrangement with two (distinct) seats swapped"""
-  i = random.randrange(0, len(prev_arrangement))
-  j = random.randrange(0, len(prev_arrangement))
-
-  while i == j:
-    j = random.randrange(0, len(prev_arrangement))
+  i, j = pick_seats_to_swap(len(prev_arrangement))
 
   next_arrangement = list(prev_arrangement)
   next_arrangement[i] = prev_arrangement[j]
@@ -228,19 +678,44 @@ def swap_seats(prev_arrangement):
 
   return tuple(next_arrangement)
 
-def run_round(profile, prev_arrangement, T, findMax):
-  """ Returns: next arrangement, based on utility increasing/decreasing total utility"""
+def get_edge_weights(profile):
+  #total utility = sum over adjacent pairs (p, o) of profile[p][o] + profile[o][p]
+  #returned as nested lists since SA only does scalar lookups
+  return (profile + profile.T).tolist()
+
+def swap_welfare_delta(edge_weights, arrangement, i, j):
+  """ Returns: change in total utility from swapping seats i and j of arrangement (a list)"""
+  #only the (at most 4) edges touching seats i and j change
+  n = len(arrangement)
+  edges = {(i-1) % n, i, (j-1) % n, j} #edge k joins seat k and seat k+1
+
+  before = 0
+  for k in edges:
+    before += edge_weights[arrangement[k]][arrangement[(k+1) % n]]
+
+  arrangement[i], arrangement[j] = arrangement[j], arrangement[i]
+  after = 0
+  for k in edges:
+    after += edge_weights[arrangement[k]][arrangement[(k+1) % n]]
+  arrangement[i], arrangement[j] = arrangement[j], arrangement[i]
+
+  delta = after - before
+  if(abs(delta) < WELFARE_TOL):
+    return 0.0 #equally good swap, don't let rounding decide if it's better or worse
+  return delta
+
+def run_round(edge_weights, arrangement, T, findMax):
+  """ Swaps two seats of arrangement (a list) in place, based on utility increasing/decreasing total utility
+  Returns: change in total utility, or None if the swap was rejected"""
   T_min = 0.001
 
-  prev_utility = calculate_total_utility(profile, prev_arrangement)
-
-  next_arrangement = swap_seats(prev_arrangement)
-  next_utility = calculate_total_utility(profile, next_arrangement)
+  i, j = pick_seats_to_swap(len(arrangement))
+  delta = swap_welfare_delta(edge_weights, arrangement, i, j)
 
   #looking for global MAX
   if findMax:
-    if next_utility >= prev_utility:
-      return next_arrangement
+    if delta >= 0:
+      accept = True
     else:
       #next_utility < prev_utility
       x = random.random()
@@ -248,17 +723,14 @@ def run_round(profile, prev_arrangement, T, findMax):
       if(T < T_min):
         prob = 0
       else:
-        prob = math.exp((next_utility-prev_utility)/T)
+        prob = math.exp(delta/T)
 
-      if(x <= prob):
-        return prev_arrangement
-      else:
-        return next_arrangement
+      accept = x > prob
     
   #global MIN
   else:
-    if next_utility <= prev_utility:
-      return next_arrangement
+    if delta <= 0:
+      accept = True
     else:
       #next_utility > prev_utility
       x = random.random()
@@ -266,45 +738,316 @@ def run_round(profile, prev_arrangement, T, findMax):
       if(T < T_min):
         prob = 0
       else:
-        prob = math.exp((prev_utility-next_utility)/T)
+        prob = math.exp(-delta/T)
       
-      if(x <= prob):
-        return prev_arrangement
-      else:
-        return next_arrangement
+      accept = x > prob
+
+  if not accept:
+    return None
 
-def run_simulated_annealing(n, people, profile, utility_func, utility_name, findMax):
+  arrangement[i], arrangement[j] = arrangement[j], arrangement[i]
+  return delta
+
+def run_simulated_annealing(n, people, profile, utility_func, utility_name, findMax, return_welfare=False):
   NUM_TIMES_TO_BE_CONVERGENT = 15
 
   #initial parameters
-  curr_arrangement = generate_random_arrangement(people) #technically this is more than the reduced number of arrangements...
+  curr_arrangement = list(generate_random_arrangement(people)) #technically this is more than the reduced number of arrangements...
   T = 2*n #NOTE: typically upper bound of total utility. normalized/binary/harmonic UB = 1*2*n=2n
   MAX_ROUNDS = 10_000
   gamma = 0.99
   prev_and_curr_same = 0
 
+  #each round only evaluates the change in welfare of the proposed swap
+  edge_weights = get_edge_weights(profile)
+  welfare = calculate_total_utility(profile, curr_arrangement)
+
   for k in range(MAX_ROUNDS):
-    prev_arrangement = curr_arrangement
-    curr_arrangement = run_round(profile, curr_arrangement, T, findMax)
+    delta = run_round(edge_weights, curr_arrangement, T, findMax)
     T *= gamma
 
-    if(prev_arrangement == curr_arrangement):
+    #a swap always changes the arrangement, so it only stays the same when the swap is rejected
+    if(delta == None):
       prev_and_curr_same += 1
     else:
+      welfare += delta
       prev_and_curr_same = 0
 
     #converged (previous and current arrangement have been the same X times)
     if(prev_and_curr_same > NUM_TIMES_TO_BE_CONVERGENT):
       break
 
-  return curr_arrangement
+  if return_welfare:
+    return tuple(curr_arrangement), welfare
+  return tuple(curr_arrangement)
   
+def propose_batched_swaps(W, chain_profile, arrangements, rng):
+  """ Swaps two random (distinct) seats in every row of arrangements (chains x n), chain c scored with the edge weights W[chain_profile[c]]
+  Returns: (the swapped arrangements, change in total utility of every chain)"""
+  n = arrangements.shape[1]
+  rows = np.arange(len(arrangements))
+
+  #two distinct seats per chain
+  i = rng.integers(0, n, len(arrangements))
+  j = (i + rng.integers(1, n, len(arrangements))) % n
+
+  #only the (at most 4) edges touching seats i and j change. edge e joins seat e and seat e+1
+  edges = np.stack([(i-1) % n, i, (j-1) % n, j], axis=1)
+  counted = np.ones(edges.shape, dtype=bool)
+  counted[:, 2] = (edges[:, 2] != edges[:, 0]) & (edges[:, 2] != edges[:, 1])
+  counted[:, 3] = (edges[:, 3] != edges[:, 0]) & (edges[:, 3] != edges[:, 1])
+
+  left, right = edges, (edges + 1) % n
+  before = W[chain_profile[:, None], arrangements[rows[:, None], left], arrangements[rows[:, None], right]]
+
+  swapped = arrangements.copy()
+  swapped[rows, i], swapped[rows, j] = arrangements[rows, j], arrangements[rows, i]
+  after = W[chain_profile[:, None], swapped[rows[:, None], left], swapped[rows[:, None], right]]
+
+  delta = ((after - before) * counted).sum(axis=1)
+  delta[np.abs(delta) < WELFARE_TOL] = 0.0 #equally good swap, don't let rounding decide if it's better or worse
+  return swapped, delta
+
+SCALAR_HANDOFF = 24 #below this many live chains, batched SA continues them with run_round
+
+def run_batched_simulated_annealing(profile, num_chains, findMax, rng=None, return_welfare=False):
+  """ Runs num_chains independent SA chains in lock-step with numpy: same schedule, moves and acceptance rule as
+  run_simulated_annealing, every chain with its own convergence counter.
+  profile: n x n (every chain on the same profile) or P x n x n (num_chains chains per profile, chain c on profile c // num_chains)
+  Returns: (chains x n) array of final arrangements (and the (chains,) array of their total utilities)"""
+  NUM_TIMES_TO_BE_CONVERGENT = 15
+  MAX_ROUNDS = 10_000
+  T_min = 0.001
+  gamma = 0.99
+
+  rng = rng if rng != None else np.random.default_rng(random.randrange(2**32))
+  profiles = profile[None] if profile.ndim == 2 else profile
+  n = profiles.shape[-1]
+  K = len(profiles) * num_chains
+
+  W = profiles + profiles.transpose(0, 2, 1)
+  chain_profile = np.repeat(np.arange(len(profiles)), num_chains)
+  arrangements = rng.random((K, n)).argsort(axis=1) #random starting arrangement for every chain
+  welfare = W[chain_profile[:, None], arrangements, np.roll(arrangements, -1, axis=1)].sum(axis=1)
+
+  T = 2*n #NOTE: typically upper bound of total utility. normalized/binary/harmonic UB = 1*2*n=2n
+  prev_and_curr_same = np.zeros(K, dtype=int)
+  active = np.arange(K) #chains that haven't converged yet
+
+  for k in range(MAX_ROUNDS):
+    #a vectorized round costs about as much as ~25 scalar ones: finish the stragglers one by one
+    if(len(active) < SCALAR_HANDOFF):
+      break
+
+    swapped, delta = propose_batched_swaps(W, chain_profile[active], arrangements[active], rng)
+
+    #better (or equal) swaps are always taken. worse ones are rejected with probability exp(-|delta|/T)
+    gain = delta if findMax else -delta
+    x = rng.random(len(active))
+    if(T < T_min):
+      prob = np.zeros(len(active))
+    else:
+      prob = np.exp(np.minimum(gain, 0) / T)
+    accept = (gain >= 0) | (x > prob)
+
+    arrangements[active[accept]] = swapped[accept]
+    welfare[active[accept]] += delta[accept]
+    T *= gamma
+
+    #converged (previous and current arrangement have been the same X times)
+    prev_and_curr_same[active] = np.where(accept, 0, prev_and_curr_same[active] + 1)
+    active = active[prev_and_curr_same[active] <= NUM_TIMES_TO_BE_CONVERGENT]
+  else:
+    k = MAX_ROUNDS
+
+  for c in active:
+    edge_weights = W[chain_profile[c]].tolist()
+    arrangement = arrangements[c].tolist()
+    T_c = T
+    for _ in range(k, MAX_ROUNDS):
+      delta = run_round(edge_weights, arrangement, T_c, findMax)
+      T_c *= gamma
+      if delta == None:
+        prev_and_curr_same[c] += 1
+        if(prev_and_curr_same[c] > NUM_TIMES_TO_BE_CONVERGENT):
+          break
+      else:
+        prev_and_curr_same[c] = 0
+        welfare[c] += delta
+    arrangements[c] = arrangement
+
+  if return_welfare:
+    return arrangements, welfare
+  return arrangements
+
+def propose_batched_reversals(W, arrangements, rng):
+  """ Reverses a random block of 2, ..., n-2 consecutive seats (wrapping around the table) in every row of arrangements (chains x n).
+  Only the 2 edges at the ends of the block change, W (n x n) is symmetric.
+  Returns: (the new arrangements, change in total utility of every chain)"""
+  num_chains, n = arrangements.shape
+  rows = np.arange(num_chains)
+
+  start = rng.integers(0, n, num_chains)
+  length = rng.integers(2, n-1, num_chains)
+
+  before_block = arrangements[rows, (start-1) % n]
+  first = arrangements[rows, start]
+  last = arrangements[rows, (start+length-1) % n]
+  after_block = arrangements[rows, (start+length) % n]
+
+  delta = W[before_block, last] + W[first, after_block] - W[before_block, first] - W[last, after_block]
+  delta[np.abs(delta) < WELFARE_TOL] = 0.0
+
+  seats = np.arange(n)[None]
+  offset = (seats - start[:, None]) % n
+  source = np.where(offset < length[:, None], (start[:, None] + length[:, None] - 1 - offset) % n, seats)
+  return np.take_along_axis(arrangements, source, axis=1), delta
+
+def run_parallel_tempering(profile, findMax, num_replicas=8, rng=None):
+  """ Replica exchange: num_replicas Metropolis chains at a geometric ladder of temperatures (block reversal moves),
+  after every step neighboring temperatures try to trade arrangements (even pairs, then odd pairs).
+  Hot replicas keep wandering between basins and hand good arrangements down to the cold ones.
+  Stops once the best total utility hasn't improved for 20*n steps (at most 100*n*n steps).
+  Returns: (best total utility found, list of distinct tables (canonical arrangements) with that utility)"""
+  n = len(profile)
+  if(n < 4): #no block reversal changes anything, every arrangement is equally good
+    arrangement = tuple(range(n))
+    return calculate_total_utility(profile, arrangement), [arrangement]
+
+  PATIENCE = 20*n
+  MAX_STEPS = 100*n*n
+  rng = rng if rng != None else np.random.default_rng(random.randrange(2**32))
+  sign = 1 if findMax else -1 #both directions maximize sign*utility
+
+  W = profile + profile.T
+  scale = max(np.ptp(W), WELFARE_TOL) #temperatures relative to how much a single edge can change
+  T = scale * 0.005 * 100 ** (np.arange(num_replicas) / (num_replicas - 1)) #0.005*scale, ..., 0.5*scale
+  beta = 1 / T
+
+  arrangements = rng.random((num_replicas, n)).argsort(axis=1)
+  welfare = W[arrangements, np.roll(arrangements, -1, axis=1)].sum(axis=1)
+  best = -np.inf
+  best_arrangements = set()
+  steps_since_improvement = 0
+
+  for step in range(MAX_STEPS):
+    #Metropolis step in every replica
+    proposed, delta = propose_batched_reversals(W, arrangements, rng)
+    gain = sign*delta
+    accept = (gain >= 0) | (rng.random(num_replicas) < np.exp(np.minimum(gain, 0) * beta))
+    arrangements[accept] = proposed[accept]
+    welfare[accept] += delta[accept]
+
+    #replica exchange between neighboring temperatures
+    lower = np.arange(step % 2, num_replicas-1, 2)
+    higher = lower + 1
+    log_prob = (beta[lower] - beta[higher]) * sign*(welfare[higher] - welfare[lower])
+    trade = rng.random(len(lower)) < np.exp(np.minimum(log_prob, 0))
+    lower, higher = lower[trade], higher[trade]
+    arrangements[lower], arrangements[higher] = arrangements[higher], arrangements[lower].copy()
+    welfare[lower], welfare[higher] = welfare[higher], welfare[lower].copy()
+
+    #keep track of the best arrangements so far
+    top = (sign*welfare).max()
+    if(top > best + WELFARE_TOL):
+      best = top
+      best_arrangements = set()
+      steps_since_improvement = 0
+    else:
+      steps_since_improvement += 1
+    if(top > best - WELFARE_TOL):
+      for r in np.flatnonzero(sign*welfare > best - WELFARE_TOL):
+        best_arrangements.add(canonical_arrangement(arrangements[r].tolist()))
+
+    if(steps_since_improvement > PATIENCE):
+      break
+
+  return sign*best, list(best_arrangements)
+
 def run_single_sa(args):
   """Helper function to run a single SA run - used for parallelization."""
   n, people, profile, utility_func, utility_name, findMax, seed = args   
   random.seed(seed) #reproducibility
   return run_simulated_annealing(n, people, profile, utility_func, utility_name, findMax)
 
+def create_shared_array(shape, dtype=np.float64):
+  """ Returns: (SharedMemory, numpy array backed by it). Workers attach to it by name with attach_shared_array"""
+  size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+  shm = shared_memory.SharedMemory(create=True, size=size)
+  return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def attach_shared_array(name, shape, dtype=np.float64):
+  """ Returns: (SharedMemory, numpy array) for a buffer made by create_shared_array, without copying it"""
+  shm = shared_memory.SharedMemory(name=name)
+  return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+_worker_profile_buffer = None #set in every SolverPool worker
+
+def _attach_profile_buffer(name, shape):
+  global _worker_profile_buffer
+  _worker_profile_buffer = attach_shared_array(name, shape)
+
+class SolverPool(ProcessPool):
+  """ Process pool whose workers are attached to a shared-memory profile buffer, so SA jobs
+  only carry (n, findMax, seed) instead of a pickled profile. Holds one profile (up to max_n guests) at a time.
+  The buffer is freed by terminate() or by join() after close(), so use it with `with` or shut it down like that"""
+
+  def __init__(self, processes, max_n):
+    self.max_n = max_n
+    self.profile_shm, self.profile_buffer = create_shared_array((max_n, max_n))
+    super().__init__(processes, initializer=_attach_profile_buffer, initargs=(self.profile_shm.name, (max_n, max_n)))
+
+  def _free_profile_buffer(self):
+    #only once, terminate() and join() can both be called
+    if(self.profile_shm != None):
+      self.profile_buffer = None
+      self.profile_shm.close()
+      self.profile_shm.unlink()
+      self.profile_shm = None
+
+  def terminate(self):
+    super().terminate()
+    self._free_profile_buffer()
+
+  def join(self):
+    super().join()
+    self._free_profile_buffer()
+
+def create_solver_pool(num_processes=None, max_n=32):
+  """ Returns: a process pool for solver jobs (single SA runs or whole per-profile pipelines).
+  Create it once per sweep and pass it to every profile, workers stay alive (with utils already imported)
+  instead of being started and torn down per profile. Jobs go in with pool.map / pool.imap_unordered / pool.apply_async."""
+  return SolverPool(num_processes or cpu_count(), max_n)
+
+def run_shared_sa(args):
+  """Helper function to run a single SA run on the profile in the worker's shared buffer - used for parallelization."""
+  n, findMax, seed = args
+  random.seed(seed) #reproducibility
+  profile = _worker_profile_buffer[1][:n, :n]
+  return run_simulated_annealing(n, list(range(n)), profile, None, None, findMax)
+
+def run_parallel_sa(pool, n, people, profile, findMax, num_runs):
+  """ Returns: final arrangements of num_runs independent SA runs on the profile, run on pool (or in this process if pool is None)"""
+  sa_seeds = [random.randrange(2**32) for _ in range(num_runs)] #each parallel process needs its own seed to produce independent runs
+
+  #profile goes through shared memory, tasks are just a seed
+  if isinstance(pool, SolverPool) and n <= pool.max_n:
+    pool.profile_buffer[:n, :n] = profile
+    return pool.map(run_shared_sa, [(n, findMax, seed) for seed in sa_seeds])
+
+  sa_args = [
+    (n, people, profile, None, None, findMax, seed) #SA doesn't use the utility function
+    for seed in sa_seeds
+  ]
+  if pool == None:
+    #run_single_sa reseeds the global RNG: put the caller's state back, so the next seeds drawn here
+    #are the same as when the runs go to a pool
+    state = random.getstate()
+    final_arrangements = list(map(run_single_sa, sa_args))
+    random.setstate(state)
+    return final_arrangements
+  return pool.map(run_single_sa, sa_args)
+
 def swap_blocking_pair_seats(prev_arrangement, seat, other):
   i = prev_arrangement.index(seat)
   j = prev_arrangement.index(other)
@@ -315,45 +1058,444 @@ def swap_blocking_pair_seats(prev_arrangement, seat, other):
 
   return tuple(next_arrangement)
 
-def run_swap_blocking_pairs(profile, arr, init_blocking_pair):
-  #swaps pairs MAX_ROUNDS times
-  #returns stable arrangement, if found. otherwise, returns None
+class BlockingPairTracker:
+  """ Finds blocking pairs of an arrangement while seats keep getting swapped.
+  A swap only changes the utility of the two moved guests and of their (up to 4) old/new neighbors,
+  so only those seats' current utilities get recomputed. Everything is indexed by seat, not guest."""
+
+  def __init__(self, profile, arrangement):
+    self.u = profile.tolist() #plain nested lists are faster than numpy for scalar lookups
+    self.seats = list(arrangement)
+    self.n = len(self.seats)
+    self.curr_utility = [self.seat_utility(i) for i in range(self.n)]
+
+    #most utility a guest can get from any two neighbors. a guest already getting it never wants to swap
+    others = profile.copy()
+    np.fill_diagonal(others, -np.inf)
+    self.best_utility = np.sort(others, axis=1)[:, -2:].sum(axis=1).tolist()
+
+  def seat_utility(self, i):
+    seats = self.seats
+    return self.u[seats[i]][seats[i-1]] + self.u[seats[i]][seats[(i+1) % self.n]]
+
+  def arrangement(self):
+    return tuple(self.seats)
+
+  def swap(self, i, j):
+    n = self.n
+    self.seats[i], self.seats[j] = self.seats[j], self.seats[i]
+
+    #only seats next to i or j got new neighbors
+    for k in {(i-1) % n, i, (i+1) % n, (j-1) % n, j, (j+1) % n}:
+      self.curr_utility[k] = self.seat_utility(k)
+
+  def first_blocking_pair(self):
+    """ Returns: seat indices (i, j) of the first blocking pair (same scan order as find_blocking_pair), or None"""
+    seats, u, n = self.seats, self.u, self.n
+    curr_utility = self.curr_utility
+
+    for i in range(n):
+      seat = seats[i]
+      utility = curr_utility[i]
+      if(utility >= self.best_utility[seat]):
+        continue
+
+      u_seat = u[seat]
+      i_left, i_right = (i-1) % n, (i+1) % n
+
+      for j in range(n):
+        if(j == i):
+          continue
+        j_left, j_right = (j-1) % n, (j+1) % n
+
+        #swapping two neighbors
+        if(j_left == i):
+          other_utility = u_seat[seats[j_right]] + u_seat[seats[j]]
+        elif(j_right == i):
+          other_utility = u_seat[seats[j_left]] + u_seat[seats[j]]
+        else:
+          other_utility = u_seat[seats[j_left]] + u_seat[seats[j_right]]
+
+        #player 1 would benefit from swapping
+        if(other_utility > utility):
+          #check if player 2 would benefit from swapping
+          u_other = u[seats[j]]
+          if(i_left == j):
+            other_utility2 = u_other[seats[i_right]] + u_other[seat]
+          elif(i_right == j):
+            other_utility2 = u_other[seats[i_left]] + u_other[seat]
+          else:
+            other_utility2 = u_other[seats[i_left]] + u_other[seats[i_right]]
+
+          if(other_utility2 > curr_utility[j]):
+            return i, j
+
+    return None
+
+def follow_blocking_pairs(profile, arr, init_blocking_pair, num_perturbations=0):
+  """ Swaps blocking pairs (first one found each time) for at most MAX_ROUNDS swaps, starting with init_blocking_pair.
+  The next swap only depends on the current arrangement, so as soon as an arrangement repeats the swaps are going in circles:
+  stop there, or if there are perturbations left, swap two random seats instead and keep going.
+  NOTE: the scan for the first blocking pair goes seat by seat, so a rotation/reflection of an arrangement can lead somewhere else.
+  only exact repeats are cycles
+  Returns: (stable arrangement or None, length of the last cycle found or None)"""
   n = len(arr)
   MAX_ROUNDS = 100*n
 
-  blocking_pair = init_blocking_pair
-  prev_arrangement = arr
-  for _ in range(MAX_ROUNDS):
-    next_arrangement = swap_blocking_pair_seats(prev_arrangement, blocking_pair[0], blocking_pair[1])
+  tracker = BlockingPairTracker(profile, arr)
+  i, j = tracker.seats.index(init_blocking_pair[0]), tracker.seats.index(init_blocking_pair[1])
+  visited = {} #arrangement -> round it was seen at
+  cycle_length = None
 
-    blocking_pair = find_blocking_pair(profile, next_arrangement)
+  for k in range(MAX_ROUNDS):
+    tracker.swap(i, j)
+
+    blocking_pair = tracker.first_blocking_pair()
     #now stable
     if(blocking_pair == None):
-      return next_arrangement
+      return tracker.arrangement(), cycle_length
+
+    state = tuple(tracker.seats)
+    if(state in visited):
+      cycle_length = k - visited[state]
+      if(num_perturbations == 0):
+        return None, cycle_length
+      num_perturbations -= 1
+      visited = {}
+      i, j = pick_seats_to_swap(n)
     else:
-      prev_arrangement = next_arrangement
+      visited[state] = k
+      i, j = blocking_pair
+  return None, cycle_length
+
+# NOTE: with class utilities, guests of the same class are interchangeable: only the class sitting in every seat matters.
+# seats i, j that aren't neighbors block each other depending only on their contexts (left class, own class, right class),
+# and there are at most k^3 contexts however many guests there are
+def find_class_blocking_pair(class_utilities, classes_by_seat):
+  """ classes_by_seat: class of the guest in every seat
+  Returns: seat indices (i, j) of a blocking pair (not necessarily the first one), or None if the arrangement is stable"""
+  classes_by_seat = np.asarray(classes_by_seat)
+  n = len(classes_by_seat)
+  u = class_utilities
+  if(n < 4): #everyone is everyone's neighbor
+    mask = blocking_pair_mask(u[np.ix_(classes_by_seat, classes_by_seat)] * (1 - np.eye(n)), range(n))
+    return tuple(int(i) for i in np.argwhere(mask)[0]) if mask.any() else None
+
+  left, right = np.roll(classes_by_seat, 1), np.roll(classes_by_seat, -1)
+  curr_utility = u[classes_by_seat, left] + u[classes_by_seat, right]
+
+  #neighbors i, i+1: they end up next to each other again
+  moves_right = u[classes_by_seat, np.roll(classes_by_seat, -2)] + u[classes_by_seat, right]
+  moves_left = u[right, left] + u[right, classes_by_seat]
+  adjacent = (moves_right > curr_utility) & (moves_left > np.roll(curr_utility, -1))
+  if(adjacent.any()):
+    i = int(adjacent.argmax())
+    return i, (i+1) % n
+
+  #everyone else, one context at a time
+  k = len(u)
+  context_of_seat = (classes_by_seat*k + left)*k + right
+  contexts, first_seat, seat_context = np.unique(context_of_seat, return_index=True, return_inverse=True)
+  c, l, r = classes_by_seat[first_seat], left[first_seat], right[first_seat]
+  would_swap = u[c[:, None], l[None, :]] + u[c[:, None], r[None, :]] > curr_utility[first_seat][:, None]
+
+  for a, b in np.argwhere(np.triu(would_swap & would_swap.T)):
+    #a seat only has 2 neighbors, so 5 seats of each context are enough to find two that aren't neighbors if there are any
+    for i in np.flatnonzero(seat_context == a)[:5]:
+      for j in np.flatnonzero(seat_context == b)[:5]:
+        if((i - j) % n not in (1, n-1)):
+          return int(i), int(j)
   return None
 
-def place_in_arrangement(n, person, arrangement, ranking, utility_func):
+def find_stable_class_arrangement(people, class_assignment, class_utilities, num_perturbations=50):
+  """ Swaps blocking pairs (find_class_blocking_pair) on the classes by seat, starting from a random arrangement.
+  When the swaps go in circles, swaps two random seats instead (at most num_perturbations times).
+  Scales to thousands of guests: the profile is never built.
+  Returns: stable arrangement or None"""
+  n = len(people)
+  MAX_ROUNDS = 100*n
+
+  classes_by_seat = np.array([class_assignment[p] for p in generate_random_arrangement(people)])
+  visited = set()
+
+  for _ in range(MAX_ROUNDS):
+    blocking_pair = find_class_blocking_pair(class_utilities, classes_by_seat)
+    if(blocking_pair == None):
+      break
+
+    i, j = blocking_pair
+    classes_by_seat[i], classes_by_seat[j] = classes_by_seat[j], classes_by_seat[i]
+
+    state = classes_by_seat.tobytes()
+    if(state in visited):
+      if(num_perturbations == 0):
+        return None
+      num_perturbations -= 1
+      visited = set()
+      i, j = pick_seats_to_swap(n)
+      classes_by_seat[i], classes_by_seat[j] = classes_by_seat[j], classes_by_seat[i]
+    visited.add(state)
+  else:
+    return None
+
+  #seat the guests of every class in its seats, in any order
+  guests_by_class = {}
+  for p in people:
+    guests_by_class.setdefault(class_assignment[p], []).append(p)
+  return tuple(guests_by_class[c].pop() for c in classes_by_seat.tolist())
+
+def run_swap_blocking_pairs(profile, arr, init_blocking_pair):
+  #swaps pairs MAX_ROUNDS times, or until the swaps go in circles
+  #returns stable arrangement, if found. otherwise, returns None
+  return follow_blocking_pairs(profile, arr, init_blocking_pair)[0]
+
+# stages of the recovery pipeline (experiments 4-7)
+# SA_MAX_STAGE/SA_MIN_STAGE: independent SA runs looking for the global max/min welfare, recovered if any end state is stable
+# SWAP_STAGE: swap blocking pairs, starting from every (unstable) end state of the SA stage before it
+SA_MAX_STAGE = "max_sa"
+SA_MIN_STAGE = "min_sa"
+SWAP_STAGE = "swap"
+PT_MAX_STAGE = "max_pt" #best arrangements of run_parallel_tempering instead of SA end states
+PT_MIN_STAGE = "min_pt"
+STABILITY_STAGE = "stability" #run_stability_search, goes for stability directly instead of through welfare
+
+#partial tables find_stable_arrangement may try when the pipeline checks whether an unrecovered profile has a stable arrangement.
+#about 6s at n=16 (~85k nodes/s). most profiles are decided in well under that, the rest are counted as unknown
+EXACT_CHECK_MAX_NODES = 500_000
+
+class TableMemo:
+  """ Stability checks for one profile, done only once per table (canonical arrangement):
+  rotations/mirror images of a table are equally (un)stable, e.g. when several SA runs end at the same optimum.
+  Blocking pair repairs are not: the swaps depend on the seats (see follow_blocking_pairs), so they are
+  done once per arrangement"""
+
+  def __init__(self, profile):
+    self.profile = profile
+    self.nonstable = set() #tables known to have a blocking pair
+    self.blocking_pairs = {} #arrangement -> its first blocking pair, for the arrangements that were checked
+    self.repaired = set() #arrangements whose blocking pairs have been swapped
+    self.to_repair = [] #unstable arrangements found by the latest search stage
+    self.stable = None #stable arrangement, once one is found
+
+  def check(self, arrangements):
+    """ Returns: True if one of the arrangements is stable, otherwise they are the next ones to repair"""
+    self.to_repair = []
+    for arrangement in arrangements:
+      arrangement = tuple(arrangement)
+      table = canonical_arrangement(arrangement)
+      if(table not in self.nonstable):
+        blocking_pair = find_blocking_pair(self.profile, arrangement)
+
+        #found stable arrangement
+        if(blocking_pair == None):
+          self.stable = arrangement
+          return True
+        self.nonstable.add(table)
+        self.blocking_pairs[arrangement] = blocking_pair
+      self.to_repair.append(arrangement)
+    return False
+
+  def repair(self):
+    """ Swaps blocking pairs starting from the arrangements of the latest search stage that haven't been tried yet
+    Returns: True if that found a stable arrangement"""
+    for arrangement in self.to_repair:
+      if(arrangement in self.repaired):
+        continue
+      self.repaired.add(arrangement)
+
+      #rotation/mirror image of a table checked before: its first blocking pair is in other seats
+      blocking_pair = self.blocking_pairs.get(arrangement)
+      if(blocking_pair == None):
+        blocking_pair = find_blocking_pair(self.profile, arrangement)
+      self.stable = run_swap_blocking_pairs(self.profile, arrangement, blocking_pair)
+      if(self.stable != None):
+        return True
+    return False
+
+def run_recovery_pipeline(n, people, profile, stages, num_sa_runs, check_exists, pool=None):
+  """ Runs the stages in order until one of them finds a stable arrangement.
+  SA runs go to pool if given (otherwise they run in this process), parallel tempering always runs in this process.
+  Returns: (index of the stage that found a stable arrangement or None,
+            whether a stable arrangement exists: only checked if nothing was recovered and check_exists, otherwise None.
+            also None if the exact search couldn't tell within EXACT_CHECK_MAX_NODES)"""
+  memo = TableMemo(profile)
+
+  for stage_idx, stage in enumerate(stages):
+    if(stage == SWAP_STAGE):
+      #try swapping blocking pairs and see if we can find a stable pair "nearby"
+      recovered = memo.repair()
+
+    elif(stage == STABILITY_STAGE):
+      recovered = memo.check([run_stability_search(profile)[0]])
+
+    elif(stage in (PT_MAX_STAGE, PT_MIN_STAGE)):
+      recovered = memo.check(run_parallel_tempering(profile, stage == PT_MAX_STAGE)[1])
+
+    else:
+      #check results from SA runs
+      recovered = memo.check(run_parallel_sa(pool, n, people, profile, stage == SA_MAX_STAGE, num_sa_runs))
+
+    if(recovered):
+      return stage_idx, None
+
+  #check all arrangements to see if a stable one exists
+  if(check_exists):
+    return None, does_stable_arr_exist_for_profile(people, profile, EXACT_CHECK_MAX_NODES)
+  return None, None
+
+def run_batched_recovery_pipeline(n, people, profiles, stages, num_sa_runs, check_exists, rng=None, memos=None):
+  """ Same as run_recovery_pipeline for every profile of profiles (P x n x n), but each SA stage runs
+  the SA chains of all the profiles that haven't been recovered yet as one batch (see run_batched_simulated_annealing).
+  memos: TableMemo of every profile, to read the stable arrangements found from afterwards
+  Returns: list of (stage index or None, stable arrangement exists), one per profile"""
+  outcomes = [(None, None)] * len(profiles)
+  pending = list(range(len(profiles))) #profiles without a stable arrangement so far
+  memos = memos if memos != None else [TableMemo(profile) for profile in profiles]
+
+  for stage_idx, stage in enumerate(stages):
+    if(len(pending) == 0):
+      break
+
+    if(stage == SWAP_STAGE):
+      #try swapping blocking pairs and see if we can find a stable pair "nearby"
+      recovered = [memos[p].repair() for p in pending]
+
+    elif(stage == STABILITY_STAGE):
+      recovered = [memos[p].check([run_stability_search(profiles[p])[0]]) for p in pending]
+
+    elif(stage in (PT_MAX_STAGE, PT_MIN_STAGE)):
+      recovered = [memos[p].check(run_parallel_tempering(profiles[p], stage == PT_MAX_STAGE, rng=rng)[1]) for p in pending]
+
+    else:
+      #check results from SA runs, chains of the k-th pending profile are rows k*num_sa_runs, ..., (k+1)*num_sa_runs-1
+      chains = run_batched_simulated_annealing(profiles[pending], num_sa_runs, stage == SA_MAX_STAGE, rng).tolist()
+      recovered = [
+        memos[p].check([tuple(arr) for arr in chains[k*num_sa_runs:(k+1)*num_sa_runs]])
+        for k, p in enumerate(pending)
+      ]
+
+    for p, found in zip(pending, recovered):
+      if(found):
+        outcomes[p] = (stage_idx, None)
+    pending = [p for p, found in zip(pending, recovered) if not found]
+
+  #check all arrangements to see if a stable one exists
+  if(check_exists):
+    for p in pending:
+      outcomes[p] = (None, does_stable_arr_exist_for_profile(people, profiles[p], EXACT_CHECK_MAX_NODES))
+  return outcomes
+
+def run_pipeline_for_index(n, utility_func, index, stages, num_sa_runs, check_exists, seed=GLOBAL_SEED, pool=None):
+  """ Runs the recovery pipeline on the index-th random profile. SA seeds also only depend on (seed, index),
+  so the outcome is the same whichever process runs it."""
+  people = list(range(n))
+  profile = generate_utilities(get_ranking_profile(people, index, False, seed), utility_func, n)
+
+  random.seed(f"sa:{seed}:{index}") #reproducibility
+  return run_recovery_pipeline(n, people, profile, stages, num_sa_runs, check_exists, pool)
+
+def solve_profile_batch(args):
+  """Helper function to run the batched pipeline on a list of profiles (all with the same n) in a worker - used for serving requests.
+  Returns: list of (stage index or None, stable arrangement found or None), one per profile"""
+  profiles, stages, num_sa_runs, seed = args
+  profiles = np.stack(profiles)
+  n = profiles.shape[-1]
+
+  random.seed(seed) #reproducibility
+  rng = np.random.default_rng(seed)
+  memos = [TableMemo(profile) for profile in profiles]
+  outcomes = run_batched_recovery_pipeline(n, list(range(n)), profiles, stages, num_sa_runs, False, rng, memos)
+  return [(stage_idx, memo.stable) for (stage_idx, _), memo in zip(outcomes, memos)]
+
+SA_BATCH_PROFILES = 64 #most profiles whose SA chains are annealed together in batched mode
+MIN_SA_BLOCKS = 64 #smaller runs go in smaller blocks, so there are enough tasks to keep every core busy
+
+def sa_block_size(num_profiles):
+  """ Returns: profiles per batched SA block for a run over num_profiles profiles. SA_BATCH_PROFILES, halved
+  until there are at least MIN_SA_BLOCKS blocks (or down to 1). only depends on num_profiles, so the block
+  boundaries (and outcomes) are the same whatever the number of processes"""
+  block_size = SA_BATCH_PROFILES
+  while(block_size > 1 and num_profiles < MIN_SA_BLOCKS*block_size):
+    block_size //= 2
+  return block_size
+
+def run_pipeline_for_index_block(n, utility_func, start, stop, stages, num_sa_runs, check_exists, seed=GLOBAL_SEED):
+  """ Runs the batched recovery pipeline on random profiles start, ..., stop-1.
+  SA seeds only depend on (seed, start), so blocks have to start at the same indices to reproduce an outcome."""
+  people = list(range(n))
+  profiles = np.stack([generate_utilities(get_ranking_profile(people, index, False, seed), utility_func, n) for index in range(start, stop)])
+
+  random.seed(f"sa:{seed}:{start}") #reproducibility
+  rng = np.random.default_rng(random.randrange(2**32))
+  return run_batched_recovery_pipeline(n, people, profiles, stages, num_sa_runs, check_exists, rng)
+
+def run_pipeline_for_index_range(args):
+  """Helper function to run the pipeline on a range of profiles - used for parallelizing over profiles.
+  sa_block: profiles go in blocks of sa_block (aligned on multiples of it) through the batched pipeline,
+  0 runs the unbatched pipeline on every profile"""
+  n, utility_func, start, stop, stages, num_sa_runs, check_exists, seed, sa_block = args
+  if(not sa_block):
+    return [run_pipeline_for_index(n, utility_func, index, stages, num_sa_runs, check_exists, seed) for index in range(start, stop)]
+
+  outcomes = []
+  for block_start in range(start, stop, sa_block):
+    block_stop = min(block_start + sa_block, stop)
+    outcomes += run_pipeline_for_index_block(n, utility_func, block_start, block_stop, stages, num_sa_runs, check_exists, seed)
+  return outcomes
+
+def split_index_range(num_items, num_processes, align=1):
+  """ Returns: (start, stop) chunks of range(num_items). big enough to amortize IPC, small enough to balance load.
+  chunk starts are multiples of align"""
+  chunk = max(1, num_items // (4*num_processes))
+  chunk = -(-chunk // align) * align
+  return [(start, min(start+chunk, num_items)) for start in range(0, num_items, chunk)]
+
+def run_pipeline_over_profiles(pool, n, utility_func, num_profiles, stages, num_sa_runs, check_exists, parallel_profiles=True, seed=GLOBAL_SEED, batched_sa=False):
+  """ Yields: (stage index or None, stable arrangement exists) for random profiles 0, ..., num_profiles-1, in no particular order.
+  parallel_profiles: every worker generates and runs the whole pipeline for a range of profiles (uses all cores).
+  otherwise: profiles go one at a time, only the SA runs of a profile are parallelized.
+  Both modes give the same outcomes.
+  batched_sa: SA chains of sa_block_size(num_profiles) profiles at a time are annealed together with numpy instead of one by one
+  (different random draws, so different outcomes than unbatched, but again the same in both modes)"""
+  sa_block = sa_block_size(num_profiles) if batched_sa else 0
+  if(not parallel_profiles):
+    if(batched_sa):
+      yield from run_pipeline_for_index_range((n, utility_func, 0, num_profiles, stages, num_sa_runs, check_exists, seed, sa_block))
+      return
+    for index in range(num_profiles):
+      yield run_pipeline_for_index(n, utility_func, index, stages, num_sa_runs, check_exists, seed, pool)
+    return
+
+  tasks = (
+    (n, utility_func, start, stop, stages, num_sa_runs, check_exists, seed, sa_block)
+    for start, stop in split_index_range(num_profiles, cpu_count(), max(1, sa_block))
+  )
+  for outcomes in pool.imap_unordered(run_pipeline_for_index_range, tasks):
+    yield from outcomes
+
+EMPTY_SEAT = -1 #guest ids are 0, ..., n-1
+
+def place_in_arrangement(n, person, arrangement, ranks, utility_func):
+  #ranks[p][o] = position of o in p's ranking (see generate_random_ranking_arrays)
   best_guest_ranked_idx = n
   best_seat_idx = -1
 
   #look for a "good" enough seat (sitting next to at least one person in your top half rankings)
   for seat_idx, seat in enumerate(arrangement):
     #only check empty seats
-    if seat == '':
+    if seat == EMPTY_SEAT:
       neighbors = get_neighbors(arrangement, seat, seat_idx)
       neighbor_ranking_idxs = [n, n] #starts out of bounds (only n-1 rankings). the lower the index, the higher rated the neighbor is.
 
       # not an empty neighbor
-      if neighbors[0] != '':
-        neighbor_ranking_idxs[0] = ranking[person].index(neighbors[0]) 
+      if neighbors[0] != EMPTY_SEAT:
+        neighbor_ranking_idxs[0] = ranks[person][neighbors[0]]
 
-      if neighbors[1] != '':
-        neighbor_ranking_idxs[1] = ranking[person].index(neighbors[1])
+      if neighbors[1] != EMPTY_SEAT:
+        neighbor_ranking_idxs[1] = ranks[person][neighbors[1]]
 
       #determine which guest is ranked higher
-      higher_ranked_guest = ''
+      higher_ranked_guest = EMPTY_SEAT
       higher_ranked_guest_idx = n
       if(neighbor_ranking_idxs[0] < neighbor_ranking_idxs[1]):
         higher_ranked_guest = neighbors[0]
@@ -374,7 +1516,7 @@ def place_in_arrangement(n, person, arrangement, ranking, utility_func):
 
     #find all empty seats
     for seat_idx, seat in enumerate(arrangement):
-      if seat == '':
+      if seat == EMPTY_SEAT:
         possible_seat_idxs.append(seat_idx)
 
     best_seat_idx = random.choice(possible_seat_idxs)
@@ -382,12 +1524,12 @@ def place_in_arrangement(n, person, arrangement, ranking, utility_func):
   arrangement[best_seat_idx] = person
   return arrangement
 
-def run_naive_sit_as_you_come(n, people, ranking, utility_func):
+def run_naive_sit_as_you_come(n, people, ranks, utility_func):
   starting_order = generate_random_arrangement(people)
-  final_arrangement = ['' for i in range(n)]  #['', '', ...]
+  final_arrangement = [EMPTY_SEAT for i in range(n)]  #[-1, -1, ...]
 
   for p in starting_order:
-    final_arrangement = place_in_arrangement(n, p, final_arrangement, ranking, utility_func)
+    final_arrangement = place_in_arrangement(n, p, final_arrangement, ranks, utility_func)
 
   return final_arrangement
 